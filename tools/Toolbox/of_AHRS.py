@@ -0,0 +1,192 @@
+"""
+Attitude and Heading Reference System (AHRS)
+ - fuse gyroscope and accelerometer into orientation quaternion
+
+ Methods:
+ complementary: integrate gyro, then blend with the tilt from accelerometer,
+                the same as Quaternion.complementary_filter.
+ madgwick:      gradient descent correction of the gyro rate towards gravity.
+ mahony:        PI feedback of the gravity direction error into the gyro rate.
+
+ All devices are processed together as (n_devices, ...) arrays,
+ state is kept in preallocated arrays and a whole block of samples
+ is processed in one call.
+
+ Units: gyro in rad/s, accel in any unit (only its direction is used).
+ Quaternion [w, x, y, z] rotates the sensor frame to the earth frame.
+
+"""
+
+import time
+import numpy
+from Toolbox import of_Math
+
+
+class FusionEngine:
+    METHODS = ('complementary', 'madgwick', 'mahony')
+
+    def __init__(self, n_devices=1, sample_freq=1000.0, method='complementary', alpha=0.98, beta=0.1, kp=1.0, ki=0.0):
+        """
+        Setup orientation fusion for several devices
+
+        Args:
+            n_devices (int, optional): number of devices fused together. Defaults to 1.
+            sample_freq (float, optional): sampling frequency in Hz. Defaults to 1000.0.
+            method (str, optional): 'complementary', 'madgwick' or 'mahony'. Defaults to 'complementary'.
+            alpha (float, optional): complementary weight of the gyro estimate. Defaults to 0.98.
+            beta (float, optional): madgwick gradient descent gain. Defaults to 0.1.
+            kp (float, optional): mahony proportional gain. Defaults to 1.0.
+            ki (float, optional): mahony integral gain. Defaults to 0.0.
+        """
+        if method not in self.METHODS:
+            raise ValueError(f'Unknown fusion method: {method}')
+
+        self.n_devices = n_devices
+        self.dt = 1.0 / sample_freq
+        self.method = method
+        self.alpha = alpha
+        self.beta = beta
+        self.kp = kp
+        self.ki = ki
+
+        # Setup state
+        self.q = numpy.zeros((n_devices, 4))            # orientation of each device
+        self.integral = numpy.zeros((n_devices, 3))     # mahony integral feedback
+        self.reset()
+
+    def reset(self):
+        # Reset orientation to identity and clear cost counters
+        self.q[:] = [1.0, 0.0, 0.0, 0.0]
+        self.integral[:] = 0.0
+        self.samples = 0        # number of samples processed, per device
+        self.elapsed = 0.0      # processing time in seconds
+
+    def update(self, gyro, accel):
+        # Fuse one sample of (n_devices, 3) gyro and accel
+        # Return with (n_devices, 4) orientation
+        return self.process(numpy.reshape(gyro, (1, self.n_devices, 3)),
+                            numpy.reshape(accel, (1, self.n_devices, 3)))[0]
+
+    def process(self, gyro, accel):
+        """
+        Fuse a block of samples for all devices
+
+        Args:
+            gyro (array): (n_samples, n_devices, 3) angular rate in rad/s.
+            accel (array): (n_samples, n_devices, 3) acceleration.
+
+        Returns:
+            array: (n_samples, n_devices, 4) orientation after each sample.
+        """
+        start = time.perf_counter()
+
+        gyro = numpy.asarray(gyro, dtype=float).reshape(-1, self.n_devices, 3)
+        accel = numpy.asarray(accel, dtype=float).reshape(-1, self.n_devices, 3)
+
+        # unit gravity direction, samples without acceleration are not corrected
+        norm = numpy.linalg.norm(accel, axis=-1, keepdims=True)
+        valid = norm[..., 0] > 0
+        accel = accel / numpy.where(valid[..., numpy.newaxis], norm, 1.0)
+
+        step = getattr(self, '_step_' + self.method)
+        output = numpy.empty((len(gyro), self.n_devices, 4))
+        for n in range(len(gyro)):
+            step(gyro[n], accel[n], valid[n])
+            output[n] = self.q
+
+        self.samples += len(gyro)
+        self.elapsed += time.perf_counter() - start
+
+        return output
+
+    def get_cost(self):
+        # Get processing cost per sample (all devices), per device sample,
+        # and the fraction of real-time budget used on this core
+        if not self.samples:
+            return {'per_sample': 0.0, 'per_device_sample': 0.0, 'load': 0.0}
+
+        per_sample = self.elapsed / self.samples
+        return {'per_sample': per_sample,
+                'per_device_sample': per_sample / self.n_devices,
+                'load': per_sample / self.dt}
+
+    def _step_complementary(self, gyro, accel, valid):
+        # integrate gyro rate as rotation about its axis
+        q_gyro = _normalize(_multiply(self.q, _axis_angle(gyro * self.dt)))
+
+        # tilt from gravity direction, keeping the yaw of the gyro estimate
+        w, x, y, z = q_gyro.T
+        roll = numpy.arctan2(accel[:, 1], accel[:, 2])
+        pitch = numpy.arctan2(-accel[:, 0], numpy.hypot(accel[:, 1], accel[:, 2]))
+        yaw = numpy.arctan2(2 * (w * z + x * y), 1 - 2 * (y ** 2 + z ** 2))
+        q_acc = of_Math.euler_to_quat_array(numpy.stack([roll, pitch, yaw], axis=-1))
+
+        # blend on the same hemisphere, as Quaternion.complementary_filter
+        q_acc[numpy.einsum('ij,ij->i', q_gyro, q_acc) < 0] *= -1
+        alpha = numpy.where(valid, self.alpha, 1.0)[:, numpy.newaxis]
+        self.q[:] = _normalize(alpha * q_gyro + (1 - alpha) * q_acc)
+
+    def _step_madgwick(self, gyro, accel, valid):
+        q0, q1, q2, q3 = self.q.T
+        ax, ay, az = accel.T
+
+        # objective: estimated minus measured gravity direction
+        f0 = 2 * (q1 * q3 - q0 * q2) - ax
+        f1 = 2 * (q0 * q1 + q2 * q3) - ay
+        f2 = 2 * (0.5 - q1 ** 2 - q2 ** 2) - az
+
+        # gradient: jacobian transposed times objective
+        s = numpy.stack([-2 * q2 * f0 + 2 * q1 * f1,
+                         2 * q3 * f0 + 2 * q0 * f1 - 4 * q1 * f2,
+                         -2 * q0 * f0 + 2 * q3 * f1 - 4 * q2 * f2,
+                         2 * q1 * f0 + 2 * q2 * f1], axis=-1)
+        norm = numpy.linalg.norm(s, axis=-1, keepdims=True)
+        s = numpy.where((norm > 0) & valid[:, numpy.newaxis], s / numpy.where(norm > 0, norm, 1.0), 0.0)
+
+        q_dot = 0.5 * _multiply(self.q, _pure(gyro)) - self.beta * s
+        self.q[:] = _normalize(self.q + q_dot * self.dt)
+
+    def _step_mahony(self, gyro, accel, valid):
+        q0, q1, q2, q3 = self.q.T
+
+        # estimated gravity direction, and its error to the measured one
+        v = numpy.stack([2 * (q1 * q3 - q0 * q2),
+                         2 * (q0 * q1 + q2 * q3),
+                         q0 ** 2 - q1 ** 2 - q2 ** 2 + q3 ** 2], axis=-1)
+        e = numpy.cross(accel, v) * valid[:, numpy.newaxis]
+
+        # PI feedback into the gyro rate
+        if self.ki > 0:
+            self.integral += self.ki * e * self.dt
+        rate = gyro + self.kp * e + self.integral
+
+        q_dot = 0.5 * _multiply(self.q, _pure(rate))
+        self.q[:] = _normalize(self.q + q_dot * self.dt)
+
+
+def _multiply(p, q):
+    # Hamilton product of (n, 4) quaternions, as Quaternion.__mul__
+    w1, x1, y1, z1 = p.T
+    w2, x2, y2, z2 = q.T
+    return numpy.stack([w1 * w2 - x1 * x2 - y1 * y2 - z1 * z2,
+                        w1 * x2 + x1 * w2 + y1 * z2 - z1 * y2,
+                        w1 * y2 - x1 * z2 + y1 * w2 + z1 * x2,
+                        w1 * z2 + x1 * y2 - y1 * x2 + z1 * w2], axis=-1)
+
+
+def _pure(v):
+    # (n, 3) vectors as pure quaternions [0, x, y, z]
+    return numpy.hstack([numpy.zeros((len(v), 1)), v])
+
+
+def _axis_angle(rotvec):
+    # (n, 3) rotation vectors (axis x angle in radians) to quaternions,
+    # as Quaternion.quat_from_axis_angle, zero rotation gives identity
+    angle = numpy.linalg.norm(rotvec, axis=-1, keepdims=True)
+    scale = numpy.sin(angle / 2) / numpy.where(angle > 0, angle, 1.0)
+    return numpy.hstack([numpy.cos(angle / 2), rotvec * scale])
+
+
+def _normalize(q):
+    # unit (n, 4) quaternions
+    return q / numpy.linalg.norm(q, axis=-1, keepdims=True)
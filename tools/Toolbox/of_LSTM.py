@@ -28,38 +28,40 @@ from Toolbox import of_Math
 
 
 class LstmParam:
-    def __init__(self, mem_cell_ct=5, x_dim=1):
+    def __init__(self, mem_cell_ct=5, x_dim=1, dtype=float):
         # setup LSTM parameters
         # recommended mem_cell_ct = 5
         # recommended x_dim = 1
+        # dtype: float (float64) or numpy.float32, shared by parameters and states
         
         # Initializing the Bias (B) and Weight (W) matrices
         
         self.mem_cell_ct = mem_cell_ct
         self.x_dim = x_dim
+        self.dtype = dtype
         concat_len = x_dim + mem_cell_ct
         
         # weight matrices
-        self.wg = of_Math.rand_arr(-0.1, 0.1, mem_cell_ct, concat_len)
-        self.wi = of_Math.rand_arr(-0.1, 0.1, mem_cell_ct, concat_len)
-        self.wf = of_Math.rand_arr(-0.1, 0.1, mem_cell_ct, concat_len)
-        self.wo = of_Math.rand_arr(-0.1, 0.1, mem_cell_ct, concat_len)
+        self.wg = of_Math.rand_arr(-0.1, 0.1, mem_cell_ct, concat_len, dtype=dtype)
+        self.wi = of_Math.rand_arr(-0.1, 0.1, mem_cell_ct, concat_len, dtype=dtype)
+        self.wf = of_Math.rand_arr(-0.1, 0.1, mem_cell_ct, concat_len, dtype=dtype)
+        self.wo = of_Math.rand_arr(-0.1, 0.1, mem_cell_ct, concat_len, dtype=dtype)
         
         # bias terms
-        self.bg = of_Math.rand_arr(-0.1, 0.1, mem_cell_ct)
-        self.bi = of_Math.rand_arr(-0.1, 0.1, mem_cell_ct)
-        self.bf = of_Math.rand_arr(-0.1, 0.1, mem_cell_ct)
-        self.bo = of_Math.rand_arr(-0.1, 0.1, mem_cell_ct)
+        self.bg = of_Math.rand_arr(-0.1, 0.1, mem_cell_ct, dtype=dtype)
+        self.bi = of_Math.rand_arr(-0.1, 0.1, mem_cell_ct, dtype=dtype)
+        self.bf = of_Math.rand_arr(-0.1, 0.1, mem_cell_ct, dtype=dtype)
+        self.bo = of_Math.rand_arr(-0.1, 0.1, mem_cell_ct, dtype=dtype)
         
         # diffs (derivative of loss function w.r.t. all parameters)
-        self.wg_diff = numpy.zeros((mem_cell_ct, concat_len))
-        self.wi_diff = numpy.zeros((mem_cell_ct, concat_len))
-        self.wf_diff = numpy.zeros((mem_cell_ct, concat_len))
-        self.wo_diff = numpy.zeros((mem_cell_ct, concat_len))
-        self.bg_diff = numpy.zeros(mem_cell_ct)
-        self.bi_diff = numpy.zeros(mem_cell_ct)
-        self.bf_diff = numpy.zeros(mem_cell_ct)
-        self.bo_diff = numpy.zeros(mem_cell_ct)
+        self.wg_diff = numpy.zeros((mem_cell_ct, concat_len), dtype=dtype)
+        self.wi_diff = numpy.zeros((mem_cell_ct, concat_len), dtype=dtype)
+        self.wf_diff = numpy.zeros((mem_cell_ct, concat_len), dtype=dtype)
+        self.wo_diff = numpy.zeros((mem_cell_ct, concat_len), dtype=dtype)
+        self.bg_diff = numpy.zeros(mem_cell_ct, dtype=dtype)
+        self.bi_diff = numpy.zeros(mem_cell_ct, dtype=dtype)
+        self.bf_diff = numpy.zeros(mem_cell_ct, dtype=dtype)
+        self.bo_diff = numpy.zeros(mem_cell_ct, dtype=dtype)
 
     def apply_diff(self, lr=1):
         # lr: the learning rate
@@ -83,14 +85,16 @@ class LstmParam:
     
 
 class LstmState:
-    def __init__(self, mem_cell_ct, x_dim):
+    def __init__(self, mem_cell_ct, x_dim, dtype=float):
         # setup LSTM state values
-        self.g = numpy.zeros(mem_cell_ct)
-        self.i = numpy.zeros(mem_cell_ct)
-        self.f = numpy.zeros(mem_cell_ct)
-        self.o = numpy.zeros(mem_cell_ct)
-        self.s = numpy.zeros(mem_cell_ct)
-        self.h = numpy.zeros(mem_cell_ct)
+        # preallocated, the forward pass writes into them in place
+        self.g = numpy.zeros(mem_cell_ct, dtype=dtype)
+        self.i = numpy.zeros(mem_cell_ct, dtype=dtype)
+        self.f = numpy.zeros(mem_cell_ct, dtype=dtype)
+        self.o = numpy.zeros(mem_cell_ct, dtype=dtype)
+        self.s = numpy.zeros(mem_cell_ct, dtype=dtype)
+        self.h = numpy.zeros(mem_cell_ct, dtype=dtype)
+        self.xc = numpy.zeros(x_dim + mem_cell_ct, dtype=dtype)
         self.bottom_diff_h = numpy.zeros_like(self.h)
         self.bottom_diff_s = numpy.zeros_like(self.s)
         
@@ -120,20 +124,33 @@ class LstmNode:
         # dot product of Wf (forget weight matrix and xc +bias) to calculate output state
         # finally multiplying forget_gate(self.state.f) with previous cell state (s_prev) to get present state.
         
-        xc = numpy.hstack((x, h_prev))
+        # all results are written in place into the preallocated state arrays
+        state, param = self.state, self.param
+        xc = numpy.concatenate((numpy.ravel(x), h_prev), out=state.xc)
         # vector representation of the input gate values
-        self.state.g = numpy.tanh(numpy.dot(self.param.wg, xc) + self.param.bg)
+        numpy.dot(param.wg, xc, out=state.g)
+        state.g += param.bg
+        numpy.tanh(state.g, out=state.g)
         # input gate select relevant data from current inputs
-        self.state.i = of_Math.sigmoid(numpy.dot(self.param.wi, xc) + self.param.bi)
+        numpy.dot(param.wi, xc, out=state.i)
+        state.i += param.bi
+        of_Math.sigmoid(state.i, out=state.i)
         # forget gate select relevant data from previous inputs
-        self.state.f = of_Math.sigmoid(numpy.dot(self.param.wf, xc) + self.param.bf)
+        numpy.dot(param.wf, xc, out=state.f)
+        state.f += param.bf
+        of_Math.sigmoid(state.f, out=state.f)
         # output gate select relevant data from the filtered inputs
-        self.state.o = of_Math.sigmoid(numpy.dot(self.param.wo, xc) + self.param.bo)
+        numpy.dot(param.wo, xc, out=state.o)
+        state.o += param.bo
+        of_Math.sigmoid(state.o, out=state.o)
         
         # get filtered inputs, from selected weighted input and selected forgotted input
-        self.state.s = self.state.g * self.state.i + s_prev * self.state.f
+        # (h holds the forgotten part until it is computed below)
+        numpy.multiply(s_prev, state.f, out=state.h)
+        numpy.multiply(state.g, state.i, out=state.s)
+        state.s += state.h
         # get hidden inputs, from selected filtered input
-        self.state.h = self.state.s * self.state.o
+        numpy.multiply(state.s, state.o, out=state.h)
         # current data
         self.xc = xc
         
@@ -180,6 +197,8 @@ class LstmNetwork():
         self.lstm_node_list = []
         # input sequence
         self.x_list = []
+        # input scaling learnt at training, of_Math.MinMaxNormalizer
+        self.normalizer = None
 
     def y_list_is(self, y_list, loss_layer):
         """
@@ -215,7 +234,7 @@ class LstmNetwork():
         self.x_list.append(x)
         if len(self.x_list) > len(self.lstm_node_list):
             # need to add new lstm node, create new state mem
-            lstm_state = LstmState(self.lstm_param.mem_cell_ct, self.lstm_param.x_dim)
+            lstm_state = LstmState(self.lstm_param.mem_cell_ct, self.lstm_param.x_dim, self.lstm_param.dtype)
             self.lstm_node_list.append(LstmNode(self.lstm_param, lstm_state))
 
         # get index of most recent x input
@@ -241,12 +260,19 @@ class LossLayer:
         return 2*(h-y)
 
 
-def model(input_x, output_y, n=1000, mem=5, x_dim=1):
+def model(input_x, output_y, n=1000, mem=5, x_dim=1, normalizer=None):
     # Train the LSTM model
     # default MEM_CELL_CT and X_DIM are 5 and 1 respectively.
+    # normalizer: of_Math.MinMaxNormalizer learning the input scaling,
+    #             a frozen copy is kept with the model and reused by test,
+    #             the caller's normalizer is left learning
     lstm = LstmNetwork(LstmParam(mem_cell_ct=mem, x_dim=x_dim))
     ll = LossLayer(mem_cell_ct=mem)
 
+    if normalizer is not None:
+        input_x = normalizer.normalize(input_x)
+        lstm.normalizer = of_Math.MinMaxNormalizer.from_state(normalizer.get_state())
+
     for i in range(n):
         lstm.x_list_clear()
         for x in input_x:
@@ -260,5 +286,8 @@ def model(input_x, output_y, n=1000, mem=5, x_dim=1):
 
 def test(lstm, val):
     # test and apply the LSTM model using value
+    # value is scaled the same as the training inputs
+    if lstm.normalizer is not None:
+        val = lstm.normalizer.normalize(val)
     lstm.x_list_add(val)
-    return lstm.lstm_node_list[-1].state.h
+    return lstm.lstm_node_list[-1].state.h.copy()
@@ -1,49 +1,463 @@
 import numpy
 import collections
+import functools
+import heapq
+import math
 
+try:
+    # optional: C implementation of the difference equation
+    from scipy import signal
+except ImportError:
+    signal = None
 
-def map(x, x_min, x_max, is_bound=True):
+
+def map(x, x_min, x_max, is_bound=True, out=None, tolist=False):
+    # normalize to the range: min and max
+    # out: preallocated output array, may be x itself for in-place
+    # tolist: convert array result to a python list
     x = numpy.asarray(x)                        # Convert input to a numpy array
-    output = (x - x_min) / (x_max - x_min)      # normalize to the range: min and max
+    out = _float_out(x, out)
+    numpy.subtract(x, x_min, out=out)
+    numpy.divide(out, x_max - x_min, out=out)
     if is_bound:                                # decide if the output bound to the range
-        output[x >= x_max] = 1.0
-        output[x <= x_min] = 0.0
+        numpy.clip(out, 0.0, 1.0, out=out)
     
-    # convert the result back to its original type: float or list 
-    return output.tolist() if isinstance(x, numpy.ndarray) else float(output)
+    # scalar input gives float, array input stays an array unless asked for a list
+    if not out.ndim:
+        return float(out)
+    return out.tolist() if tolist else out
+
 
+def _float_out(x, out=None):
+    # output buffer for elementwise helpers: out, or a new array shaped as x
+    # floating point x keeps its precision (e.g. float32), otherwise float64
+    if out is not None:
+        return out
+    return numpy.empty(x.shape, dtype=x.dtype if x.dtype.kind == 'f' else float)
 
-def nearest(array, val):
+
+def nearest(array, val, is_sorted=False):
     # get the index of array that has value closest to val
+    # is_sorted: array is increasing, binary search and val can be an array of queries
+    if is_sorted:
+        return NearestIndex(array, assume_sorted=True).query(val)
+
     array = numpy.asarray(array)
     return (numpy.abs(array - val)).argmin()
+
+
+class NearestIndex:
+    """
+    A lookup index answering nearest-value queries by binary search, O(log N) each,
+    for single or vectorized batch queries. Unsorted arrays are sorted once.
+    Ties resolve to the lowest index, the same as nearest().
+    """
+    def __init__(self, array, assume_sorted=None):
+        # assume_sorted: True if array is known to be increasing,
+        #   None to detect it (one O(N) pass), False to always sort
+        array = numpy.asarray(array, dtype=float).ravel()
+        if assume_sorted is None:
+            assume_sorted = bool(numpy.all(array[1:] >= array[:-1]))
+
+        self.order = None if assume_sorted else numpy.argsort(array, kind='stable')
+        self.sorted = array if assume_sorted else array[self.order]
+
+    def _original(self, i):
+        # index into the original array
+        return i if self.order is None else self.order[i]
+
+    def query(self, val):
+        # Get the index of array that has value closest to val (number or array)
+        v = numpy.asarray(val, dtype=float)
+        s = self.sorted
+        if len(s) < 2:
+            return numpy.zeros(v.shape, dtype=int)[()]
+
+        # candidates on both sides, first occurrence of repeated values
+        right = numpy.clip(numpy.searchsorted(s, v, side='left'), 1, len(s) - 1)
+        left = numpy.searchsorted(s, s[right - 1], side='left')
+
+        dl, dr = numpy.abs(v - s[left]), numpy.abs(s[right] - v)
+        il, ir = self._original(left), self._original(right)
+        return numpy.where((dl < dr) | ((dl == dr) & (il < ir)), il, ir)[()]
+
+    def neighbours(self, val):
+        # Get indices of the values on both sides of val (number or array),
+        # and weight of the right one for linear interpolation, clipped at both ends
+        # i.e. value at val = (1 - weight) * data[left] + weight * data[right]
+        v = numpy.asarray(val, dtype=float)
+        s = self.sorted
+        if len(s) < 2:
+            zeros = numpy.zeros(v.shape, dtype=int)[()]
+            return zeros, zeros, numpy.zeros(v.shape)[()]
+
+        i = numpy.clip(numpy.searchsorted(s, v, side='right') - 1, 0, len(s) - 2)
+        span = s[i + 1] - s[i]
+        weight = numpy.clip((v - s[i]) / numpy.where(span > 0, span, 1.0), 0.0, 1.0)
+
+        return self._original(i)[()], self._original(i + 1)[()], weight[()]
+
+    def interpolate(self, data, val):
+        # Linearly interpolate data (aligned with the indexed array) at val
+        # e.g. align a stream onto the timestamps of another stream
+        left, right, weight = self.neighbours(val)
+        data = numpy.asarray(data, dtype=float)
+        weight = numpy.reshape(weight, numpy.shape(weight) + (1,) * (data.ndim - 1))
+        return (1 - weight) * data[left] + weight * data[right]
     
     
 def get_fourier(array, rate):
     # get the fourier transform plot (x-y axes)
+    # real FFT only computes the positive half, the frequency axis is cached
     n = len(array)
-    fft = numpy.fft.fft(numpy.asarray(array))[1:n//2]
-    freq = numpy.fft.fftfreq(n, 1/rate)[1:n//2]
+    fft = numpy.fft.rfft(numpy.asarray(array))[1:n//2]
+    freq = _fourier_freq(n, rate)
     energy = numpy.abs(fft) ** 2
     
     return freq, energy
 
 
-def sigmoid(x):
-    return 1. / (1 + numpy.exp(-x))
+@functools.lru_cache(maxsize=32)
+def _fourier_freq(n, rate):
+    # positive frequency axis of get_fourier, without DC
+    freq = numpy.fft.rfftfreq(n, 1/rate)[1:n//2]
+    freq.flags.writeable = False
+    return freq
+
 
+def sigmoid(x, out=None):
+    # numerically stable: exp(-log(1 + exp(-x))) never overflows,
+    # and keeps relative precision for large negative x
+    x = numpy.asarray(x)
+    out = _float_out(x, out)
+    numpy.negative(x, out=out)
+    numpy.logaddexp(0, out, out=out)
+    numpy.negative(out, out=out)
+    numpy.exp(out, out=out)
+    return out if out.ndim else out[()]
 
-def sigmoid_derivative(values):
-    return values * (1 - values)
 
+def sigmoid_derivative(values, out=None):
+    # out must not be values itself
+    values = numpy.asarray(values)
+    out = _float_out(values, out)
+    numpy.subtract(1, values, out=out)
+    numpy.multiply(values, out, out=out)
+    return out if out.ndim else out[()]
 
-def tanh_derivative(values):
-    return 1. - values ** 2
 
+def tanh_derivative(values, out=None):
+    values = numpy.asarray(values)
+    out = _float_out(values, out)
+    numpy.square(values, out=out)
+    numpy.subtract(1., out, out=out)
+    return out if out.ndim else out[()]
 
-def rand_arr(a, b, *args):
+
+def rand_arr(a, b, *args, dtype=None, out=None):
     # create uniform random array with values in [a, b) and shaped in args
-    return numpy.random.rand(*args) * (b - a) + a
+    # out: fill a preallocated array instead, shaped and typed as out
+    # drawn from the global numpy.random state, so numpy.random.seed applies
+    if out is None:
+        out = numpy.random.rand(*args)
+        if dtype is not None:
+            out = numpy.asarray(out, dtype=dtype)
+    else:
+        out[...] = numpy.random.random_sample(out.shape)
+    out *= (b - a)
+    out += a
+    return out
+
+
+def iir_filter(b, a, data, zi=None, axis=0):
+    """
+    Run the 2nd order difference equation over a whole block of samples,
+    in direct-form II transposed with explicit initial and final state.
+
+    The coefficients follow Butterworth.butter, i.e. feedback terms are added:
+        y[n] = b0 x[n] + b1 x[n-1] + b2 x[n-2] + a1 y[n-1] + a2 y[n-2]
+
+    Args:
+        b (array): feed-forward coefficients, shape (3,),
+            or (n_signals, 3) for one set of coefficients per signal.
+        a (array): feedback coefficients, same shape as b. a[..., 0] is unused.
+        data (array): input samples, filtered along axis.
+        zi (array, optional): initial state, shaped as data without axis plus (2,).
+            Defaults to None, i.e. filter starts at rest.
+        axis (int, optional): the time axis of data. Defaults to 0.
+
+    Returns:
+        tuple: (output, zf) where zf is the final state in the same layout as zi,
+            pass it as zi of the next block to filter chunked data seamlessly.
+    """
+    data = numpy.asarray(data, dtype=float)
+
+    # flatten to (n_samples, n_signals) with time along the first axis
+    x = numpy.moveaxis(data, axis, 0)
+    shape = x.shape
+    x = x.reshape(shape[0], int(numpy.prod(shape[1:])))
+
+    # coefficients per signal: [c0, c1, c2]
+    b = numpy.broadcast_to(numpy.asarray(b, dtype=float), (x.shape[1], 3))
+    a = numpy.broadcast_to(numpy.asarray(a, dtype=float), (x.shape[1], 3))
+
+    # state per signal: [z0, z1]
+    z = numpy.zeros(shape[1:] + (2,)) if zi is None else numpy.broadcast_to(zi, shape[1:] + (2,))
+    z = numpy.array(z, dtype=float).reshape(-1, 2)
+
+    if signal is not None and x.shape[1] > 0 and (b == b[0]).all() and (a == a[0]).all():
+        # shared coefficients: a single C call for all signals
+        # scipy convention: a[0] y[n] = ... - a[1] y[n-1] - a[2] y[n-2]
+        y, zf = signal.lfilter(b[0], [1.0, -a[0, 1], -a[0, 2]], x, axis=0, zi=z.T)
+        zf = zf.T
+
+    elif signal is not None:
+        # one C call per signal
+        y, zf = numpy.empty_like(x), numpy.empty_like(z)
+        for k in range(x.shape[1]):
+            y[:, k], zf[k] = signal.lfilter(b[k], [1.0, -a[k, 1], -a[k, 2]], x[:, k], zi=z[k])
+
+    else:
+        y, zf = _df2t(b, a, x, z)
+
+    # restore the original layout
+    y = numpy.moveaxis(y.reshape(shape), 0, axis)
+    zf = zf.reshape(shape[1:] + (2,))
+
+    return y, zf
+
+
+def _df2t(b, a, x, z):
+    # Direct-form II transposed recursion over (n_samples, n_signals) block
+    # with (n_signals, 3) coefficients, fallback when scipy is not available
+    y = numpy.empty_like(x)
+    zf = numpy.empty_like(z)
+
+    if x.shape[0] >= x.shape[1]:
+        # long blocks: iterate each signal on python floats,
+        # much cheaper than stepping numpy arrays sample by sample
+        for k in range(x.shape[1]):
+            b0, b1, b2 = b[k].tolist()
+            _, a1, a2 = a[k].tolist()
+            z0, z1 = z[k].tolist()
+            out = []
+            for xn in x[:, k].tolist():
+                yn = b0 * xn + z0
+                z0 = b1 * xn + a1 * yn + z1
+                z1 = b2 * xn + a2 * yn
+                out.append(yn)
+            y[:, k] = out
+            zf[k] = z0, z1
+
+    else:
+        # many signals, few samples: one vectorized step per sample across signals
+        b0, b1, b2 = b[:, 0], b[:, 1], b[:, 2]
+        a1, a2 = a[:, 1], a[:, 2]
+        z0, z1 = z[:, 0], z[:, 1]
+        for n in range(x.shape[0]):
+            y[n] = b0 * x[n] + z0
+            z0 = b1 * x[n] + a1 * y[n] + z1
+            z1 = b2 * x[n] + a2 * y[n]
+        zf[:, 0], zf[:, 1] = z0, z1
+
+    return y, zf
+
+
+def sos_filter(sos, data, zi=None, axis=0):
+    """
+    Run cascaded second-order sections over a whole block of samples.
+
+    Args:
+        sos (array): sections as (n_sections, 6) rows of [b0, b1, b2, a0, a1, a2],
+            each in the convention of iir_filter (feedback terms are added).
+        data (array): input samples, filtered along axis.
+        zi (array, optional): initial state, shaped as (n_sections,) plus
+            data without axis plus (2,). Defaults to None, i.e. filter starts at rest.
+        axis (int, optional): the time axis of data. Defaults to 0.
+
+    Returns:
+        tuple: (output, zf) where zf is the final state in the same layout as zi.
+    """
+    sos = numpy.asarray(sos, dtype=float)
+    x = numpy.moveaxis(numpy.asarray(data, dtype=float), axis, 0)
+
+    shape = (sos.shape[0],) + x.shape[1:] + (2,)
+    z = numpy.zeros(shape) if zi is None else numpy.broadcast_to(zi, shape)
+
+    if signal is not None:
+        # all sections in a single C call
+        # scipy convention: [b0, b1, b2, 1, -a1, -a2]
+        sos_scipy = numpy.hstack([sos[:, :3], numpy.ones((len(sos), 1)), -sos[:, 4:]])
+        y, zf = signal.sosfilt(sos_scipy, x, axis=0, zi=numpy.moveaxis(z, -1, 1))
+        zf = numpy.moveaxis(zf, 1, -1)
+    else:
+        # one block pass per section
+        y, zf = x, numpy.empty(shape)
+        for k in range(sos.shape[0]):
+            y, zf[k] = iir_filter(sos[k, :3], sos[k, 3:], y, zi=z[k])
+
+    return numpy.moveaxis(y, 0, axis), zf
+
+
+def butter_sos(order, cutoff, sample_freq, mode='low'):
+    """
+    Design N-th order Butterworth filter as cascaded second-order sections.
+    Designs are cached, so repeated instantiation does not redo the math.
+
+    Args:
+        order (int): filter order, band designs have 2 x order poles.
+        cutoff (float or tuple): cutoff frequency, or (low, high) for band modes.
+        sample_freq (float): sampling frequency.
+        mode (str, optional): 'low', 'high', 'bandpass' or 'bandstop'. Defaults to 'low'.
+
+    Returns:
+        array: read-only (n_sections, 6) sections for sos_filter.
+    """
+    cutoff = tuple(numpy.ravel(cutoff).tolist()) if numpy.ndim(cutoff) else float(cutoff)
+    return _butter_sos(int(order), cutoff, float(sample_freq), mode)
+
+
+@functools.lru_cache(maxsize=128)
+def _butter_sos(order, cutoff, sample_freq, mode):
+    # analog prototype: poles evenly spaced on the left half of unit circle
+    k = numpy.arange(1, order + 1)
+    p = numpy.exp(1j * numpy.pi * (2 * k + order - 1) / (2 * order))
+
+    # pre-warp the cutoff frequencies for bilinear transform
+    fs2 = 2.0 * sample_freq
+    warped = fs2 * numpy.tan(numpy.pi * numpy.asarray(cutoff) / sample_freq)
+
+    # transform prototype to the requested mode, as zeros, poles and gain
+    if mode == 'low':
+        z, p, gain = numpy.array([]), p * warped, warped ** order
+    elif mode == 'high':
+        z, p, gain = numpy.zeros(order), warped / p, 1.0
+    elif mode in ('bandpass', 'bandstop'):
+        wo = numpy.sqrt(warped[0] * warped[1])
+        bw = warped[1] - warped[0]
+        if mode == 'bandpass':
+            half = p * bw / 2
+            z, gain = numpy.zeros(order), bw ** order
+        else:
+            half = (bw / 2) / p
+            z, gain = numpy.concatenate([numpy.full(order, 1j * wo), numpy.full(order, -1j * wo)]), 1.0
+        shift = numpy.sqrt(half ** 2 - wo ** 2)
+        p = numpy.concatenate([half + shift, half - shift])
+    else:
+        raise ValueError(f'Unknown filter mode: {mode}')
+
+    # bilinear transform to digital, missing zeros go to Nyquist
+    gain = gain * numpy.real(numpy.prod(fs2 - z) / numpy.prod(fs2 - p))
+    z = numpy.append((fs2 + z) / (fs2 - z), -numpy.ones(len(p) - len(z)))
+    p = (fs2 + p) / (fs2 - p)
+
+    # group roots into 2nd order polynomials, poles nearest to unit circle last
+    poles = sorted(_quadratics(p), key=lambda c: c[2])
+    zeros = _quadratics(z)
+
+    sos = numpy.zeros((len(poles), 6))
+    for i, (num, den) in enumerate(zip(zeros, poles)):
+        sos[i, :3] = num
+        sos[i, 4:] = -den[1], -den[2]
+    sos[0, :3] *= gain
+
+    sos.flags.writeable = False
+    return sos
+
+
+def _quadratics(roots):
+    # Pair up roots as polynomials [1, c1, c2] in z^-1
+    # complex roots with their conjugate, real roots two by two
+    real = numpy.abs(roots.imag) <= 1e-10 * numpy.maximum(1.0, numpy.abs(roots))
+    polys = [[1.0, -2.0 * r.real, abs(r) ** 2] for r in roots[~real] if r.imag > 0]
+
+    # pair smallest with largest real root, e.g. a zero at -1 with one at +1
+    r = numpy.sort(roots[real].real)
+    for i in range(len(r) // 2):
+        polys.append([1.0, -(r[i] + r[-1 - i]), r[i] * r[-1 - i]])
+    if len(r) % 2:
+        polys.append([1.0, -r[len(r) // 2], 0.0])
+
+    return polys
+
+
+def iir_filter_zi(b, a):
+    # Steady state of iir_filter for a unit step input
+    # scale by the first sample to start a filter without transient
+    b, a = numpy.asarray(b, dtype=float), numpy.asarray(a, dtype=float)
+    y = b.sum(axis=-1) / (1.0 - a[..., 1] - a[..., 2])
+    z1 = b[..., 2] + a[..., 2] * y
+    z0 = b[..., 1] + a[..., 1] * y + z1
+    return numpy.stack([z0, z1], axis=-1)
+
+
+def sos_filter_zi(sos):
+    # Steady state of sos_filter for a unit step input
+    # each section sees the step scaled by the DC gain of the sections before
+    sos = numpy.asarray(sos, dtype=float)
+    zi = iir_filter_zi(sos[:, :3], sos[:, 3:])
+    gain = sos[:, :3].sum(axis=1) / (1.0 - sos[:, 4] - sos[:, 5])
+    return zi * numpy.cumprod(numpy.append(1.0, gain[:-1]))[:, numpy.newaxis]
+
+
+def filtfilt(b, a, data, axis=0, padlen=None):
+    """
+    Zero-phase filtering: run iir_filter forward and backward over the data.
+
+    Args:
+        b (array): feed-forward coefficients, shape (3,).
+        a (array): feedback coefficients, shape (3,).
+        data (array): input samples, e.g. a whole recorded session.
+        axis (int, optional): the time axis of data. Defaults to 0.
+        padlen (int, optional): number of samples of odd extension at both ends.
+            Defaults to None, i.e. 3 x number of coefficients.
+
+    Returns:
+        array: filtered data with no phase shift, same shape as data.
+    """
+    padlen = 3 * len(b) if padlen is None else padlen
+    return _filtfilt(lambda x, zi: iir_filter(b, a, x, zi=zi)[0], iir_filter_zi(b, a), data, axis, padlen)
+
+
+def sos_filtfilt(sos, data, axis=0, padlen=None):
+    """
+    Zero-phase filtering: run sos_filter forward and backward over the data.
+
+    Args:
+        sos (array): (n_sections, 6) second-order sections, e.g. from butter_sos.
+        data (array): input samples, e.g. a whole recorded session.
+        axis (int, optional): the time axis of data. Defaults to 0.
+        padlen (int, optional): number of samples of odd extension at both ends.
+            Defaults to None, i.e. 3 x (2 x n_sections + 1).
+
+    Returns:
+        array: filtered data with no phase shift, same shape as data.
+    """
+    padlen = 3 * (2 * len(sos) + 1) if padlen is None else padlen
+    return _filtfilt(lambda x, zi: sos_filter(sos, x, zi=zi)[0], sos_filter_zi(sos), data, axis, padlen)
+
+
+def _filtfilt(run, zi, data, axis, padlen):
+    # Forward-backward pass of run(x, zi) along the first axis
+    # starting each pass at steady state to suppress the edge transient
+    x = numpy.moveaxis(numpy.asarray(data, dtype=float), axis, 0)
+    if x.shape[0] <= padlen:
+        raise ValueError(f'Data length {x.shape[0]} must be greater than padlen {padlen}')
+
+    # odd extension about the end points
+    if padlen:
+        x = numpy.concatenate([2 * x[0] - x[padlen:0:-1], x, 2 * x[-1] - x[-2:-padlen - 2:-1]])
+
+    # steady state, laid out for the signal shape and scaled by the first sample
+    zi = zi.reshape(zi.shape[:-1] + (1,) * (x.ndim - 1) + (2,))
+
+    y = run(x, zi * x[0][..., numpy.newaxis])
+    y = run(y[::-1], zi * y[-1][..., numpy.newaxis])[::-1]
+
+    if padlen:
+        y = y[padlen:-padlen]
+
+    return numpy.moveaxis(y, 0, axis)
 
 
 class Butterworth:
@@ -99,22 +513,146 @@ class Butterworth:
         else:
             return None
         
+    def get_state(self):
+        # Direct-form II transposed state equivalent to the feed() buffers
+        # i.e. the contribution of past samples to the next two outputs
+        x1, x2 = self.buffer_in[0], self.buffer_in[1]
+        y1, y2 = self.buffer_out[0], self.buffer_out[1]
+        z1 = self.b[2] * x1 + self.a[2] * y1
+        z0 = self.b[1] * x1 + self.a[1] * y1 + self.b[2] * x2 + self.a[2] * y2
+        return numpy.array([z0, z1])
+
     def filt(self, data):
         if self.enable:
-            
-            # Prepare filter output data array
-            output = numpy.zeros(data.shape)
-            
-            # Feed input data into filter and put output to data array
-            for i in range(len(data)):
-                output[i] = self.feed(data[i])
-                
+
+            # Filter the whole block at once, continuing from the current state
+            data = numpy.asarray(data, dtype=float)
+            output, _ = iir_filter(self.b, self.a, data, zi=self.get_state())
+
+            # Shift the most recent samples into buffer,
+            # so that next filt() or feed() continues seamlessly
+            self.buffer_in.extendleft(data[-2:].tolist())
+            self.buffer_out.extendleft(output[-2:].tolist())
+
             return output
-        
+
+        else:
+            return None
+
+    def filtfilt(self, data, axis=0):
+        # Zero-phase filtering of a whole recording, along axis
+        # Independent of the streaming state used by feed() and filt()
+        if self.enable:
+            return filtfilt(self.b, self.a, data, axis=axis)
+
         else:
             return None
         
 
+class ButterworthBank:
+    """
+    A bank of 2nd order Butterworth filters, one per channel,
+    filtering (n_samples, n_channels) blocks in one vectorized call.
+    Coefficients are held as (n_channels, 3) and state as (n_channels, 2) arrays.
+    """
+    def __init__(self, n_channels):
+        self.n_channels = n_channels
+        # Setup coefficients
+        self.a = numpy.zeros((n_channels, Butterworth.FILTER_BUFFER_SIZE))
+        self.b = numpy.zeros((n_channels, Butterworth.FILTER_BUFFER_SIZE))
+        # Setup filter state, in direct-form II transposed
+        self.zi = numpy.zeros((n_channels, Butterworth.FILTER_BUFFER_SIZE - 1))
+
+        self.enable = numpy.ones(n_channels, dtype=bool)
+
+    def set_enable(self, val, channel=None):
+        # Enable or disable all channels, or only the selected channel(s)
+        if type(val) is bool:
+            self.enable[slice(None) if channel is None else channel] = val
+
+    def butter(self, sample_freq, cutoff=None, mode='low', channel=None):
+        # Design the same 2nd order filter as Butterworth.butter
+        # for all channels, or only the selected channel(s)
+        a, b = Butterworth().butter(sample_freq, cutoff, mode)
+        self.a[slice(None) if channel is None else channel] = a
+        self.b[slice(None) if channel is None else channel] = b
+
+        return self.a, self.b
+
+    def reset(self):
+        # Clear the filter state of all channels
+        self.zi[:] = 0.0
+
+    def feed(self, frame):
+        # Filter one frame of n_channels samples
+        return self.filt(numpy.asarray(frame, dtype=float)[numpy.newaxis])[0]
+
+    def filt(self, data):
+        # Filter (n_samples, n_channels) block, continuing from the current state
+        # Disabled channels pass through unchanged and keep their state
+        output = numpy.array(data, dtype=float)
+
+        on = self.enable
+        if on.any():
+            output[:, on], self.zi[on] = iir_filter(self.b[on], self.a[on], output[:, on], zi=self.zi[on])
+
+        return output
+
+
+class ButterworthSOS:
+    """
+    N-th order Butterworth filter (low, high, band-pass, band-stop)
+    evaluated as cascaded second-order sections, with streaming state.
+    """
+    def __init__(self, order=4):
+        self.order = order      # filter order
+        self.sos = None         # second-order sections
+        self.zi = None          # filter state, None when at rest
+
+        self.set_enable(True)
+
+    def set_enable(self, val):
+        if type(val) is bool:
+            self.enable = val
+
+    def butter(self, sample_freq, cutoff=None, mode='low'):
+        # cutoff is (low, high) for 'bandpass' and 'bandstop' mode
+        self.sos = butter_sos(self.order, cutoff, sample_freq, mode)
+        self.reset()
+
+        return self.sos
+
+    def reset(self):
+        # Clear the filter state
+        self.zi = None
+
+    def feed(self, data_in):
+        if self.enable:
+            return self.filt(numpy.array([data_in], dtype=float))[0]
+
+        else:
+            return None
+
+    def filt(self, data):
+        if self.enable:
+
+            # Filter the whole block, continuing from the current state
+            output, self.zi = sos_filter(self.sos, data, zi=self.zi)
+            return output
+
+        else:
+            return None
+
+    def filtfilt(self, data, axis=0):
+        # Zero-phase filtering of a whole recording, along axis
+        # Independent of the streaming state used by feed() and filt()
+        if self.enable:
+            return sos_filtfilt(self.sos, data, axis=axis)
+
+        else:
+            return None
+
+
 class Quaternion:
     def __init__(self, w=None, x=None, y=None, z=None):
         if w is None or x is None or y is None or z is None:
@@ -297,6 +835,130 @@ class Quaternion:
         return q_rot.vector[1:]
     
     
+class QuaternionArray:
+    """
+    A batch of N quaternions held as one (N, 4) array of [w, x, y, z],
+    following the conventions of Quaternion, vectorized over the batch.
+    Operands may also be a single Quaternion, which is broadcast to the batch.
+    """
+    def __init__(self, vector=None):
+        self.vector = numpy.zeros((0, 4)) if vector is None else numpy.asarray(vector, dtype=float).reshape(-1, 4)
+
+    @classmethod
+    def from_quaternions(cls, quats):
+        # Collect a sequence of Quaternion into one batch
+        return cls([q.vector for q in quats])
+
+    @classmethod
+    def from_euler(cls, angles):
+        # Batch of Quaternion.euler_to_quat, from (N, 3) of [roll, pitch, yaw] in radians
+        return cls(euler_to_quat_array(angles))
+
+    @classmethod
+    def from_rot_matrix(cls, R):
+        # Batch of Quaternion.quat_from_rot_matrix, from (N, 3, 3) rotation matrices
+        return cls(quat_from_rot_matrix_array(R))
+
+    def to_quaternions(self):
+        # Split the batch into a list of Quaternion
+        return [Quaternion(*q) for q in self.vector.tolist()]
+
+    def __len__(self):
+        return len(self.vector)
+
+    def __getitem__(self, index):
+        # Integer index gives a Quaternion, slice or mask gives a QuaternionArray
+        if isinstance(index, (int, numpy.integer)):
+            return Quaternion(*self.vector[index].tolist())
+        return QuaternionArray(self.vector[index])
+
+    @property
+    def w(self):
+        return self.vector[:, 0]
+
+    @property
+    def x(self):
+        return self.vector[:, 1]
+
+    @property
+    def y(self):
+        return self.vector[:, 2]
+
+    @property
+    def z(self):
+        return self.vector[:, 3]
+
+    def __mul__(self, quat):
+        w1, x1, y1, z1 = self.vector.T
+        w2, x2, y2, z2 = _quat_vector(quat).T
+        w = w1 * w2 - x1 * x2 - y1 * y2 - z1 * z2
+        x = w1 * x2 + x1 * w2 + y1 * z2 - z1 * y2
+        y = w1 * y2 - x1 * z2 + y1 * w2 + z1 * x2
+        z = w1 * z2 + x1 * y2 - y1 * x2 + z1 * w2
+        return QuaternionArray(numpy.stack([w, x, y, z], axis=-1))
+
+    def __add__(self, quat):
+        return QuaternionArray(self.vector + _quat_vector(quat))
+
+    def scale(self, scalar):
+        # scalar is a number, or one number per quaternion
+        return QuaternionArray(self.vector * numpy.reshape(scalar, (-1, 1)))
+
+    def norm(self):
+        # Get magnitude of each quaternion
+        return numpy.sqrt(numpy.einsum('ij,ij->i', self.vector, self.vector))
+
+    def normalize(self):
+        # Get unit quaternions, zero quaternions become identity
+        n = self.norm()[:, numpy.newaxis]
+        identity = numpy.array([1.0, 0.0, 0.0, 0.0])
+        return QuaternionArray(numpy.where(n == 0, identity, self.vector / numpy.where(n == 0, 1.0, n)))
+
+    def inv(self):
+        # Inverse of each quaternion
+        # For unit quaternion, inverse is equal to conjugate
+        return QuaternionArray(self.vector * numpy.array([1.0, -1.0, -1.0, -1.0]))
+
+    def dot(self, quat):
+        # Dot product with each quaternion
+        return numpy.einsum('ij,ij->i', *numpy.broadcast_arrays(self.vector, _quat_vector(quat)))
+
+    def complementary_filter(self, quat, alpha):
+        # alpha is a number, or one number per quaternion
+        alpha = numpy.reshape(alpha, (-1, 1))
+        return QuaternionArray(alpha * self.vector + (1 - alpha) * _quat_vector(quat)).normalize()
+
+    def quat_to_euler(self):
+        # Convert quaternions to euler angles (roll, pitch, yaw) in degrees
+        # [w, x, y, z] -> (N, 3) of [roll, pitch, yaw]
+        return quat_to_euler_array(self.vector)
+
+    def relative_angle(self, quat):
+        # Angle between each pair of quaternions, in degrees
+        rel = (QuaternionArray(_quat_vector(quat)).inv() * self).vector
+        return 2 * numpy.arctan2(numpy.linalg.norm(rel[:, 1:4], axis=1), rel[:, 0]) / numpy.pi * 180.0
+
+    def rotate(self, vectors):
+        # Rotate (N, 3) vectors, i.e. q * v * q.inv() for each pair
+        # Return with the updated (N, 3) vectors
+        v = numpy.asarray(vectors, dtype=float).reshape(-1, 3)
+        w = self.vector[:, :1]
+        u = self.vector[:, 1:]
+        uv = numpy.cross(u, v)
+        return ((w ** 2 - numpy.sum(u * u, axis=1, keepdims=True)) * v
+                + 2.0 * numpy.sum(u * v, axis=1, keepdims=True) * u
+                + 2.0 * w * uv)
+
+
+def _quat_vector(quat):
+    # (N, 4) array of a Quaternion, QuaternionArray or array-like
+    if isinstance(quat, Quaternion):
+        return quat.vector.reshape(1, 4)
+    if isinstance(quat, QuaternionArray):
+        return quat.vector
+    return numpy.asarray(quat, dtype=float).reshape(-1, 4)
+
+
 class Rotation:
     def __init__(self, matrix=None):
         if matrix is not None:
@@ -428,48 +1090,979 @@ class Rotation:
         return (phi_deg, theta_deg, psi_deg)
     
     
+def euler_to_quat_array(angles):
+    """
+    Batch version of Quaternion.euler_to_quat.
+
+    Args:
+        angles (array): (N, 3) of [roll, pitch, yaw] in radians.
+
+    Returns:
+        array: (N, 4) unit quaternions of [w, x, y, z].
+    """
+    half = numpy.asarray(angles, dtype=float).reshape(-1, 3) * 0.5
+    cr, cp, cy = numpy.cos(half).T
+    sr, sp, sy = numpy.sin(half).T
+
+    q = numpy.stack([cr * cp * cy + sr * sp * sy,
+                     sr * cp * cy - cr * sp * sy,
+                     cr * sp * cy + sr * cp * sy,
+                     cr * cp * sy - sr * sp * cy], axis=-1)
+
+    return QuaternionArray(q).normalize().vector
+
+
+def quat_to_euler_array(q):
+    """
+    Batch version of Quaternion.quat_to_euler.
+
+    Args:
+        q (array): (N, 4) quaternions of [w, x, y, z].
+
+    Returns:
+        array: (N, 3) of [roll, pitch, yaw] in degrees.
+    """
+    w, x, y, z = numpy.asarray(q, dtype=float).reshape(-1, 4).T
+
+    # Roll (x-axis rotation)
+    roll = numpy.arctan2(2.0 * (w * x + y * z), 1.0 - 2.0 * (x ** 2 + y ** 2))
+
+    # Pitch (y-axis rotation), use 90 degrees if out of range
+    sinp = 2.0 * (w * y - z * x)
+    pitch = numpy.where(numpy.abs(sinp) >= 1, numpy.sign(sinp) * (numpy.pi / 2),
+                        numpy.arcsin(numpy.clip(sinp, -1.0, 1.0)))
+
+    # Yaw (z-axis rotation)
+    yaw = numpy.arctan2(2 * (w * z + x * y), 1 - 2 * (y ** 2 + z ** 2))
+
+    return numpy.stack([roll, pitch, yaw], axis=-1) / numpy.pi * 180.0
+
+
+def quat_from_rot_matrix_array(R):
+    """
+    Batch version of Quaternion.quat_from_rot_matrix,
+    each branch on the trace is evaluated only on the matrices it applies to.
+
+    Args:
+        R (array): (N, 3, 3) orthogonal matrices with determinant +1.
+
+    Returns:
+        array: (N, 4) quaternions of [w, x, y, z].
+    """
+    R = numpy.asarray(R, dtype=float).reshape(-1, 3, 3)
+    r11, r22, r33 = R[:, 0, 0], R[:, 1, 1], R[:, 2, 2]
+    tr = r11 + r22 + r33
+
+    # same branch order as the scalar version
+    case_w = tr > 0
+    case_x = ~case_w & (r11 > r22) & (r11 > r33)
+    case_y = ~case_w & ~case_x & (r22 > r33)
+    case_z = ~case_w & ~case_x & ~case_y
+
+    q = numpy.empty((len(R), 4))
+    for case, i, j, k in ((case_w, 0, 1, 2), (case_x, 1, 2, 3),
+                          (case_y, 2, 3, 1), (case_z, 3, 1, 2)):
+        if not case.any():
+            continue
+        m = R[case]
+        if i == 0:
+            s = numpy.sqrt(1.0 + tr[case]) * 2
+            q[case] = numpy.stack([s / 4,
+                                   (m[:, 2, 1] - m[:, 1, 2]) / s,
+                                   (m[:, 0, 2] - m[:, 2, 0]) / s,
+                                   (m[:, 1, 0] - m[:, 0, 1]) / s], axis=-1)
+            continue
+
+        # dominant diagonal element at a = i - 1, the other axes b and c
+        a, b, c = i - 1, j - 1, k - 1
+        s = numpy.sqrt(1.0 + m[:, a, a] - m[:, b, b] - m[:, c, c]) * 2
+        q[case, 0] = (m[:, c, b] - m[:, b, c]) / s
+        q[case, i] = s / 4
+        q[case, j] = (m[:, a, b] + m[:, b, a]) / s
+        q[case, k] = (m[:, a, c] + m[:, c, a]) / s
+
+    return q
+
+
+def euler_to_matrix_array(angles):
+    """
+    Batch version of Rotation.euler_to_matrix, i.e. R_z @ R_y @ R_x.
+
+    Args:
+        angles (array): (N, 3) of [roll, pitch, yaw] in radians.
+
+    Returns:
+        array: (N, 3, 3) rotation matrices.
+    """
+    angles = numpy.asarray(angles, dtype=float).reshape(-1, 3)
+    cr, cp, cy = numpy.cos(angles).T
+    sr, sp, sy = numpy.sin(angles).T
+
+    R = numpy.empty((len(angles), 3, 3))
+    R[:, 0, 0] = cy * cp
+    R[:, 0, 1] = cy * sp * sr - sy * cr
+    R[:, 0, 2] = cy * sp * cr + sy * sr
+    R[:, 1, 0] = sy * cp
+    R[:, 1, 1] = sy * sp * sr + cy * cr
+    R[:, 1, 2] = sy * sp * cr - cy * sr
+    R[:, 2, 0] = -sp
+    R[:, 2, 1] = cp * sr
+    R[:, 2, 2] = cp * cr
+
+    return R
+
+
+def matrix_to_euler_array(R):
+    """
+    Batch version of Rotation.matrix_to_euler (X-Y-Z intrinsic rotation sequence),
+    with the gimbal lock branch applied by mask.
+
+    Args:
+        R (array): (N, 3, 3) rotation matrices.
+
+    Returns:
+        array: (N, 3) of [roll, pitch, yaw] in degrees, each ranging from -180 to 180 degrees.
+    """
+    R = numpy.asarray(R, dtype=float).reshape(-1, 3, 3)
+    r11, r12, r21, r22 = R[:, 0, 0], R[:, 0, 1], R[:, 1, 0], R[:, 1, 1]
+    r31, r32, r33 = R[:, 2, 0], R[:, 2, 1], R[:, 2, 2]
+
+    # Compute the pitch angle theta
+    # Clamp the value to avoid numerical issues with arcsin
+    theta_rad = numpy.arcsin(-numpy.clip(r31, -1.0, 1.0))
+
+    # Gimbal lock when cos(theta) is close to zero
+    # then set roll to zero and compute yaw based on available information
+    EPS = 1e-6
+    lock = numpy.abs(numpy.cos(theta_rad)) <= EPS
+
+    phi_rad = numpy.where(lock, 0.0, numpy.arctan2(r32, r33))
+    psi_rad = numpy.where(lock,
+                          numpy.where(r31 <= -1.0, numpy.arctan2(-r12, r22), numpy.arctan2(r12, r22)),
+                          numpy.arctan2(r21, r11))
+
+    # Normalize the angles to be within -180 to 180 degrees
+    angles = numpy.degrees(numpy.stack([phi_rad, theta_rad, psi_rad], axis=-1))
+    return ((angles + 180) % 360) - 180
+
+
+class RotationArray:
+    """
+    A stack of N rotation matrices held as one (N, 3, 3) array,
+    following the conventions of Rotation, vectorized over the stack.
+    Operands may also be a single Rotation, which is broadcast to the stack.
+    """
+    def __init__(self, matrix=None):
+        self.matrix = numpy.eye(3)[numpy.newaxis] if matrix is None else numpy.asarray(matrix, dtype=float).reshape(-1, 3, 3)
+
+    @classmethod
+    def identity(cls, n):
+        return cls(numpy.tile(numpy.eye(3), (n, 1, 1)))
+
+    @classmethod
+    def from_rotations(cls, rotations):
+        # Collect a sequence of Rotation into one stack
+        return cls([r.matrix for r in rotations])
+
+    @classmethod
+    def from_euler(cls, angles):
+        # Batch of Rotation.euler_to_matrix, from (N, 3) of [roll, pitch, yaw] in radians
+        return cls(euler_to_matrix_array(angles))
+
+    def to_rotations(self):
+        # Split the stack into a list of Rotation
+        return [Rotation(m) for m in self.matrix]
+
+    def to_quaternions(self):
+        # Convert the stack into QuaternionArray
+        return QuaternionArray.from_rot_matrix(self.matrix)
+
+    def __len__(self):
+        return len(self.matrix)
+
+    def __getitem__(self, index):
+        # Integer index gives a Rotation, slice or mask gives a RotationArray
+        if isinstance(index, (int, numpy.integer)):
+            return Rotation(self.matrix[index])
+        return RotationArray(self.matrix[index])
+
+    def __mul__(self, rotation):
+        return RotationArray(numpy.matmul(self.matrix, _rotation_matrix(rotation)))
+
+    def relative_to(self, reference):
+        # Rotation relative to reference, e.g. joint angle between body segments
+        # reference is a single Rotation, or one per matrix
+        return RotationArray(numpy.matmul(_rotation_matrix(reference).swapaxes(-1, -2), self.matrix))
+
+    def matrix_to_euler(self):
+        # Convert to (N, 3) of [roll, pitch, yaw] in degrees
+        return matrix_to_euler_array(self.matrix)
+
+    def orthonormalize(self):
+        # Nearest proper rotation to each matrix (polar decomposition by SVD),
+        # removes the drift accumulated by repeated composition
+        u, _, vt = numpy.linalg.svd(self.matrix)
+        u[:, :, -1] *= numpy.sign(numpy.linalg.det(numpy.matmul(u, vt)))[:, numpy.newaxis]
+        return RotationArray(numpy.matmul(u, vt))
+
+
+def _rotation_matrix(rotation):
+    # (N, 3, 3) array of a Rotation, RotationArray or array-like
+    if isinstance(rotation, (Rotation, RotationArray)):
+        return numpy.asarray(rotation.matrix, dtype=float).reshape(-1, 3, 3)
+    return numpy.asarray(rotation, dtype=float).reshape(-1, 3, 3)
+
+
+def nlerp(q0, q1, t):
+    """
+    Normalized linear interpolation between quaternions, along the shortest path.
+
+    Args:
+        q0 (array): (N, 4) start quaternions of [w, x, y, z].
+        q1 (array): (N, 4) end quaternions.
+        t (array): (N,) interpolation fractions in [0, 1].
+
+    Returns:
+        array: (N, 4) unit quaternions.
+    """
+    q0, q1 = _quat_vector(q0), _quat_vector(q1)
+    t = numpy.reshape(t, (-1, 1))
+    q1 = numpy.where(numpy.sum(q0 * q1, axis=1, keepdims=True) < 0, -q1, q1)
+    return QuaternionArray((1 - t) * q0 + t * q1).normalize().vector
+
+
+def slerp(q0, q1, t):
+    """
+    Spherical linear interpolation between unit quaternions, along the shortest path.
+    Nearly identical pairs fall back to nlerp, where slerp is ill-conditioned.
+
+    Args:
+        q0 (array): (N, 4) start unit quaternions of [w, x, y, z].
+        q1 (array): (N, 4) end unit quaternions.
+        t (array): (N,) interpolation fractions in [0, 1].
+
+    Returns:
+        array: (N, 4) unit quaternions.
+    """
+    q0, q1 = _quat_vector(q0), _quat_vector(q1)
+    t = numpy.reshape(t, (-1, 1))
+
+    # take the shortest path
+    dot = numpy.sum(q0 * q1, axis=1, keepdims=True)
+    q1 = numpy.where(dot < 0, -q1, q1)
+    dot = numpy.abs(dot)
+
+    # angle between the pairs, close pairs are linearly interpolated
+    close = dot > 0.9995
+    theta = numpy.arccos(numpy.clip(dot, -1.0, 1.0))
+    sin_theta = numpy.where(close, 1.0, numpy.sin(theta))
+    w0 = numpy.where(close, 1 - t, numpy.sin((1 - t) * theta) / sin_theta)
+    w1 = numpy.where(close, t, numpy.sin(t * theta) / sin_theta)
+
+    return QuaternionArray(w0 * q0 + w1 * q1).normalize().vector
+
+
+def resample_quaternions(t, q, t_new, method='slerp'):
+    """
+    Resample an orientation stream at irregular timestamps onto new timestamps,
+    e.g. a uniform time grid, in one pass with searchsorted.
+
+    Args:
+        t (array): (M,) increasing timestamps of the input stream.
+        q (array): (M, 4) unit quaternions at t.
+        t_new (array): (K,) timestamps to resample at. Outside of t the end values are held.
+        method (str, optional): 'slerp' or 'nlerp'. Defaults to 'slerp'.
+
+    Returns:
+        array: (K, 4) unit quaternions at t_new.
+    """
+    t = numpy.asarray(t, dtype=float).ravel()
+    q = _quat_vector(q)
+    t_new = numpy.asarray(t_new, dtype=float).ravel()
+    interpolate = {'slerp': slerp, 'nlerp': nlerp}[method]
+
+    if len(t) == 1:
+        return numpy.repeat(q, len(t_new), axis=0)
+
+    # index of the interval [t[i], t[i + 1]] containing each new timestamp
+    i = numpy.clip(numpy.searchsorted(t, t_new, side='right') - 1, 0, len(t) - 2)
+    span = t[i + 1] - t[i]
+    frac = numpy.clip((t_new - t[i]) / numpy.where(span > 0, span, 1.0), 0.0, 1.0)
+
+    return interpolate(q[i], q[i + 1], frac)
+
+
+class QuaternionResampler:
+    """
+    A streaming resampler for orientation at jittery, uneven timestamps,
+    emitting frames on a uniform time grid as soon as the input covers them.
+    """
+    def __init__(self, period, start=None, method='slerp'):
+        self.period = period        # time step of the output grid
+        self.start = start          # time of the first grid point, None to use the first input time
+        self.method = method        # 'slerp' or 'nlerp'
+        self.k = 0                  # index of the next grid point to emit
+        self.last_t = None          # last input sample, to interpolate across blocks
+        self.last_q = None
+
+    def feed(self, t, q):
+        # New block of input samples arrived, in time order
+        # Return with (t_out, q_out) of the grid points covered so far
+        t = numpy.asarray(t, dtype=float).ravel()
+        q = _quat_vector(q)
+        if self.last_t is not None:
+            t = numpy.append(self.last_t, t)
+            q = numpy.vstack([self.last_q, q])
+        if not len(t):
+            return numpy.zeros(0), numpy.zeros((0, 4))
+        if self.start is None:
+            self.start = t[0]
+
+        # grid points up to the most recent input time
+        k_end = int(numpy.floor((t[-1] - self.start) / self.period))
+        t_out = self.start + numpy.arange(self.k, k_end + 1) * self.period
+        q_out = resample_quaternions(t, q, t_out, self.method)
+
+        self.k = max(self.k, k_end + 1)
+        self.last_t, self.last_q = t[-1], q[-1:]
+
+        return t_out, q_out
+
+
 class SlidingWindow:
     """
     A sliding window buffer maintains the most recent N samples 
     required for operations like moving average and adaptive thresholding.
+
+    Samples are kept in a preallocated ring buffer, written twice (at i and i + N),
+    so the window is always one contiguous slice and can be viewed without copying.
+
+    Statistics are kept as power sums of (sample - shift), with shift close to the mean,
+    and are re-summed exactly from the window every N samples (amortized O(1)),
+    so float drift cannot accumulate over hours of streaming.
     """
     def __init__(self, size):
-        self.size = size        # window size
-        self.buffer = []        # window content
-        self.cumsum = 0.0       # maintain cumulative sum of the window
-        self.cumsum_sq = 0.0    # maintain cumulative squared sum of the window
+        self.size = size                        # window size
+        self.buffer = numpy.zeros(2 * size)     # window content, mirrored ring buffer
+        self.index = 0                          # position of the next sample in ring buffer
+        self.count = 0                          # number of samples in the window
+        self.shift = 0.0                        # reference value of the power sums
+        self.sums = [0.0, 0.0, 0.0, 0.0]        # maintain sums of (sample - shift) ** 1..4
+        self.updates = 0                        # number of samples since the last exact re-sum
 
     def add_sample(self, sample):
         # New sample arrived
-        self.buffer.append(sample)
-        
+        # overwrite the most old sample once the window is full
+        i = self.index
+        s1, s2, s3, s4 = self.sums
+        if self.count == self.size:
+            d = self.buffer[i] - self.shift
+            d2 = d * d
+            s1, s2, s3, s4 = s1 - d, s2 - d2, s3 - d2 * d, s4 - d2 * d2
+        elif self.count:
+            self.count += 1
+        else:
+            # first sample: take it as the reference value
+            self.count, self.shift = 1, sample
+
         # update the window content and statistics
-        # append most new sample and pop most old sample
-        self.cumsum += sample
-        self.cumsum_sq += sample ** 2
-        if len(self.buffer) > self.size:
-            removed = self.buffer.pop(0)
-            self.cumsum -= removed
-            self.cumsum_sq -= removed ** 2
+        self.buffer[i] = self.buffer[i + self.size] = sample
+        self.index = (i + 1) % self.size
+        d = sample - self.shift
+        d2 = d * d
+        self.sums = [s1 + d, s2 + d2, s3 + d2 * d, s4 + d2 * d2]
+
+        # periodically discard the accumulated rounding error
+        self.updates += 1
+        if self.updates >= self.size:
+            self.resum()
+
+    def add_samples(self, samples):
+        # New block of samples arrived, in time order
+        samples = numpy.asarray(samples, dtype=float).ravel()
+        n = len(samples)
+
+        if n >= self.size:
+            # the block replaces the whole window
+            self.buffer[:self.size] = self.buffer[self.size:] = samples[-self.size:]
+            self.index, self.count = 0, self.size
+            self.resum()
+            return
+
+        if n and not self.count:
+            # first samples: take the first one as the reference value
+            self.shift = samples[0]
+
+        # the most old samples pushed out of the window
+        removed = self.get_window(copy=False)[:max(0, self.count + n - self.size)]
+        delta = self._power_sums(samples) - self._power_sums(removed)
+
+        # update the window content
+        idx = (self.index + numpy.arange(n)) % self.size
+        self.buffer[idx] = self.buffer[idx + self.size] = samples
+        self.index = (self.index + n) % self.size
+        self.count = min(self.count + n, self.size)
+
+        # update the statistics, or re-sum if it is due anyway
+        self.updates += n
+        if self.updates >= self.size:
+            self.resum()
+        else:
+            self.sums = (numpy.array(self.sums) + delta).tolist()
+
+    def resum(self):
+        # Recompute the statistics exactly from the window content
+        # re-centered on the current mean to avoid cancellation
+        window = self.get_window(copy=False)
+        self.shift = float(window.mean()) if self.count else 0.0
+        self.sums = self._power_sums(window).tolist()
+        self.updates = 0
+
+    def _power_sums(self, samples):
+        # sums of (samples - shift) ** 1..4
+        d = samples - self.shift
+        d2 = d * d
+        return numpy.array([d.sum(), d2.sum(), (d2 * d).sum(), (d2 * d2).sum()])
+
+    def get_moments(self):
+        # Get mean and central moments (2nd, 3rd, 4th) of the window
+        n = self.count
+        m1, m2, m3, m4 = (s / n for s in self.sums)
+        var = m2 - m1 ** 2
+        mu3 = m3 - 3 * m1 * m2 + 2 * m1 ** 3
+        mu4 = m4 - 4 * m1 * m3 + 6 * m1 ** 2 * m2 - 3 * m1 ** 4
+        return self.shift + m1, var, mu3, mu4
 
     def get_mean(self):
         # Get average value of the window
         # Handle buffer not available case
-        if not self.buffer:
+        if not self.count:
             return 0.0
         
-        return self.cumsum / len(self.buffer)
+        return self.shift + self.sums[0] / self.count
 
     def get_std(self):
         # Get standard derivation value of the window
         # Handle buffer not available case
-        if not self.buffer:
+        if not self.count:
             return 0.0
         
-        mean = self.get_mean()
-        variance = (self.cumsum_sq / len(self.buffer)) - (mean ** 2)
+        _, variance, _, _ = self.get_moments()
         return variance ** 0.5 if variance > 0 else 0.0
 
-    def get_window(self):
-        # Get the window
-        return self.buffer.copy()
\ No newline at end of file
+    def get_skewness(self):
+        # Get skewness of the window (3rd standardized moment)
+        # Handle buffer not available, or constant window case
+        if not self.count:
+            return 0.0
+
+        _, variance, mu3, _ = self.get_moments()
+        return mu3 / variance ** 1.5 if variance > 0 else 0.0
+
+    def get_kurtosis(self):
+        # Get excess kurtosis of the window (4th standardized moment - 3)
+        # Handle buffer not available, or constant window case
+        if not self.count:
+            return 0.0
+
+        _, variance, _, mu4 = self.get_moments()
+        return mu4 / variance ** 2 - 3.0 if variance > 0 else 0.0
+
+    def get_window(self, copy=True):
+        # Get the window, from the most old to the most new sample
+        # copy=False returns a read-only view, valid until the next sample arrives
+        start = (self.index - self.count) % self.size if self.count else 0
+        window = self.buffer[start:start + self.count]
+        if copy:
+            return window.copy()
+
+        window = window.view()
+        window.flags.writeable = False
+        return window
+
+
+class MultiSlidingWindow:
+    """
+    A sliding window over several channels, maintaining the most recent N frames
+    in one preallocated (2N, n_channels) mirrored ring buffer, see SlidingWindow.
+    Statistics are returned as per-channel vectors.
+    """
+    def __init__(self, size, n_channels):
+        self.size = size                                        # window size
+        self.n_channels = n_channels                            # number of channels
+        self.buffer = numpy.zeros((2 * size, n_channels))       # window content, mirrored ring buffer
+        self.index = 0                                          # position of the next frame in ring buffer
+        self.count = 0                                          # number of frames in the window
+        self.shift = numpy.zeros(n_channels)                    # reference value of the power sums
+        self.sums = numpy.zeros((2, n_channels))                # maintain sums of (frame - shift) ** 1..2
+        self.updates = 0                                        # number of frames since the last exact re-sum
+
+    def add_sample(self, frame):
+        # New frame of n_channels samples arrived
+        # overwrite the most old frame once the window is full
+        frame = numpy.asarray(frame, dtype=float)
+        i = self.index
+        if self.count == self.size:
+            d = self.buffer[i] - self.shift
+            self.sums[0] -= d
+            self.sums[1] -= d * d
+        elif self.count:
+            self.count += 1
+        else:
+            # first frame: take it as the reference value
+            self.count, self.shift = 1, frame.copy()
+
+        # update the window content and statistics
+        self.buffer[i] = self.buffer[i + self.size] = frame
+        self.index = (i + 1) % self.size
+        d = frame - self.shift
+        self.sums[0] += d
+        self.sums[1] += d * d
+
+        # periodically discard the accumulated rounding error
+        self.updates += 1
+        if self.updates >= self.size:
+            self.resum()
+
+    def add_samples(self, frames):
+        # New block of (n_frames, n_channels) arrived, in time order
+        frames = numpy.asarray(frames, dtype=float).reshape(-1, self.n_channels)
+        n = len(frames)
+
+        if n >= self.size:
+            # the block replaces the whole window
+            self.buffer[:self.size] = self.buffer[self.size:] = frames[-self.size:]
+            self.index, self.count = 0, self.size
+            self.resum()
+            return
+
+        if n and not self.count:
+            # first frames: take the first one as the reference value
+            self.shift = frames[0].copy()
+
+        # the most old frames pushed out of the window
+        removed = self.get_window(copy=False)[:max(0, self.count + n - self.size)]
+        delta = self._power_sums(frames) - self._power_sums(removed)
+
+        # update the window content
+        idx = (self.index + numpy.arange(n)) % self.size
+        self.buffer[idx] = self.buffer[idx + self.size] = frames
+        self.index = (self.index + n) % self.size
+        self.count = min(self.count + n, self.size)
+
+        # update the statistics, or re-sum if it is due anyway
+        self.updates += n
+        if self.updates >= self.size:
+            self.resum()
+        else:
+            self.sums += delta
+
+    def resum(self):
+        # Recompute the statistics exactly from the window content
+        # re-centered on the current mean to avoid cancellation
+        window = self.get_window(copy=False)
+        self.shift = window.mean(axis=0) if self.count else numpy.zeros(self.n_channels)
+        self.sums = self._power_sums(window)
+        self.updates = 0
+
+    def _power_sums(self, frames):
+        # per-channel sums of (frames - shift) ** 1..2
+        d = frames - self.shift
+        return numpy.stack([d.sum(axis=0), (d * d).sum(axis=0)])
+
+    def get_mean(self):
+        # Get average value of each channel
+        # Handle buffer not available case
+        if not self.count:
+            return numpy.zeros(self.n_channels)
+
+        return self.shift + self.sums[0] / self.count
+
+    def get_std(self):
+        # Get standard derivation value of each channel
+        # Handle buffer not available case
+        if not self.count:
+            return numpy.zeros(self.n_channels)
+
+        m1 = self.sums[0] / self.count
+        variance = self.sums[1] / self.count - m1 ** 2
+        return numpy.sqrt(numpy.maximum(variance, 0.0))
+
+    def get_max(self):
+        # Get maximum value of each channel
+        # Handle buffer not available case
+        if not self.count:
+            return numpy.zeros(self.n_channels)
+
+        return self.get_window(copy=False).max(axis=0)
+
+    def get_min(self):
+        # Get minimum value of each channel
+        # Handle buffer not available case
+        if not self.count:
+            return numpy.zeros(self.n_channels)
+
+        return self.get_window(copy=False).min(axis=0)
+
+    def get_stats(self):
+        # Get (mean, std, min, max) of each channel in a single call
+        return self.get_mean(), self.get_std(), self.get_min(), self.get_max()
+
+    def get_window(self, copy=True):
+        # Get the window as (n_frames, n_channels), from the most old to the most new frame
+        # copy=False returns a read-only view, valid until the next frame arrives
+        start = (self.index - self.count) % self.size if self.count else 0
+        window = self.buffer[start:start + self.count]
+        if copy:
+            return window.copy()
+
+        window = window.view()
+        window.flags.writeable = False
+        return window
+
+
+class SlidingMinMax:
+    """
+    A sliding window tracking the minimum and maximum of the most recent N samples,
+    using monotonic deques of (index, sample), O(1) amortized per sample.
+    """
+    def __init__(self, size):
+        self.size = size                        # window size
+        self.count = 0                          # number of samples seen so far
+        self.max_deque = collections.deque()    # decreasing samples, front is the maximum
+        self.min_deque = collections.deque()    # increasing samples, front is the minimum
+
+    def add_sample(self, sample):
+        # New sample arrived
+        # drop samples which can no longer be the maximum / minimum
+        i = self.count
+        while self.max_deque and self.max_deque[-1][1] <= sample:
+            self.max_deque.pop()
+        while self.min_deque and self.min_deque[-1][1] >= sample:
+            self.min_deque.pop()
+        self.max_deque.append((i, sample))
+        self.min_deque.append((i, sample))
+
+        # drop the sample leaving the window
+        if self.max_deque[0][0] <= i - self.size:
+            self.max_deque.popleft()
+        if self.min_deque[0][0] <= i - self.size:
+            self.min_deque.popleft()
+
+        self.count += 1
+
+    def add_samples(self, samples):
+        # New block of samples arrived, in time order
+        for sample in numpy.asarray(samples, dtype=float).ravel().tolist():
+            self.add_sample(sample)
+
+    def get_max(self):
+        # Get maximum value of the window
+        # Handle buffer not available case
+        return self.max_deque[0][1] if self.max_deque else 0.0
+
+    def get_min(self):
+        # Get minimum value of the window
+        # Handle buffer not available case
+        return self.min_deque[0][1] if self.min_deque else 0.0
+
+
+class SlidingQuantile:
+    """
+    A sliding window tracking a quantile (the median by default) of the most recent N samples,
+    using two heaps with lazy deletion, O(log N) per sample.
+
+    The lower heap holds the smallest floor(q (n - 1)) + 1 samples, so the quantile
+    is interpolated between the tops of both heaps, the same as numpy.quantile.
+    """
+    def __init__(self, size, q=0.5):
+        self.size = size                        # window size
+        self.q = q                              # quantile to track, in [0, 1]
+        self.window = collections.deque()       # window content as (sample, seq) in time order
+        self.lo = []                            # max-heap of (-sample, -seq), the lower part
+        self.hi = []                            # min-heap of (sample, seq), the upper part
+        self.n_lo = 0                           # number of valid samples in the lower part
+        self.n_hi = 0                           # number of valid samples in the upper part
+        self.removed = set()                    # seq of samples left the window but still in heaps
+        self.seq = 0                            # arrival number of the next sample
+
+    def add_sample(self, sample):
+        # New sample arrived
+        key = (float(sample), self.seq)
+        self.seq += 1
+        self.window.append(key)
+
+        if self.lo and key <= self._lo_top():
+            heapq.heappush(self.lo, (-key[0], -key[1]))
+            self.n_lo += 1
+        else:
+            heapq.heappush(self.hi, key)
+            self.n_hi += 1
+
+        # drop the most old sample leaving the window
+        if len(self.window) > self.size:
+            self._remove(self.window.popleft())
+
+        self._balance()
+
+    def add_samples(self, samples):
+        # New block of samples arrived, in time order
+        for sample in numpy.asarray(samples, dtype=float).ravel().tolist():
+            self.add_sample(sample)
+
+    def _lo_top(self):
+        return -self.lo[0][0], -self.lo[0][1]
+
+    def _remove(self, key):
+        # Lazy deletion: only mark the sample, drop it once it reaches a heap top
+        self.removed.add(key[1])
+        if self.lo and key <= self._lo_top():
+            self.n_lo -= 1
+        else:
+            self.n_hi -= 1
+        self._prune()
+
+    def _prune(self):
+        # Drop removed samples from the heap tops
+        while self.lo and -self.lo[0][1] in self.removed:
+            self.removed.discard(-heapq.heappop(self.lo)[1])
+        while self.hi and self.hi[0][1] in self.removed:
+            self.removed.discard(heapq.heappop(self.hi)[1])
+
+        # Samples buried deep in a heap may never reach the top, e.g. on a trend,
+        # rebuild both heaps once they hold more removed than valid samples
+        if len(self.removed) > self.size:
+            self.lo = [item for item in self.lo if -item[1] not in self.removed]
+            self.hi = [item for item in self.hi if item[1] not in self.removed]
+            heapq.heapify(self.lo)
+            heapq.heapify(self.hi)
+            self.removed.clear()
+
+    def _balance(self):
+        # Move samples between heaps, so the lower part holds floor(q (n - 1)) + 1 samples
+        n = self.n_lo + self.n_hi
+        k = math.floor(self.q * (n - 1)) + 1 if n else 0
+        while self.n_lo > k:
+            value, seq = heapq.heappop(self.lo)
+            heapq.heappush(self.hi, (-value, -seq))
+            self.n_lo -= 1
+            self.n_hi += 1
+            self._prune()
+        while self.n_lo < k:
+            value, seq = heapq.heappop(self.hi)
+            heapq.heappush(self.lo, (-value, -seq))
+            self.n_lo += 1
+            self.n_hi -= 1
+            self._prune()
+
+    def get_quantile(self):
+        # Get the quantile of the window, linearly interpolated
+        # Handle buffer not available case
+        n = self.n_lo + self.n_hi
+        if not n:
+            return 0.0
+
+        h = self.q * (n - 1)
+        frac = h - math.floor(h)
+        lower = self._lo_top()[0]
+        if frac > 0:
+            return lower + frac * (self.hi[0][0] - lower)
+
+        return lower
+
+    def get_median(self):
+        # Get the median of the window, when tracking q = 0.5
+        return self.get_quantile()
+
+
+def rolling_max(array, size):
+    """
+    Maximum of the trailing window of each sample, vectorized (van Herk / Gil-Werman).
+
+    Args:
+        array (array): input samples, 1-D.
+        size (int): window size. The first size - 1 outputs use the samples available.
+
+    Returns:
+        array: rolling maximum, same length as array.
+    """
+    return _rolling_extreme(array, size, numpy.maximum, -numpy.inf)
+
+
+def rolling_min(array, size):
+    """
+    Minimum of the trailing window of each sample, vectorized (van Herk / Gil-Werman).
+
+    Args:
+        array (array): input samples, 1-D.
+        size (int): window size. The first size - 1 outputs use the samples available.
+
+    Returns:
+        array: rolling minimum, same length as array.
+    """
+    return _rolling_extreme(array, size, numpy.minimum, numpy.inf)
+
+
+def _rolling_extreme(array, size, ufunc, fill):
+    # Split the padded data into blocks of window size;
+    # any window spans at most two blocks, so its extreme is the suffix extreme
+    # of the first block combined with the prefix extreme of the second block
+    x = numpy.asarray(array, dtype=float).ravel()
+    n = len(x)
+    nb = -(-(n + size - 1) // size)
+    padded = numpy.full(nb * size, fill)
+    padded[size - 1:size - 1 + n] = x
+
+    blocks = padded.reshape(nb, size)
+    prefix = ufunc.accumulate(blocks, axis=1).ravel()
+    suffix = ufunc.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].ravel()
+
+    return ufunc(suffix[:n], prefix[size - 1:size - 1 + n])
+
+
+def rolling_quantile(array, size, q=0.5):
+    """
+    Quantile of the trailing window of each sample, using SlidingQuantile.
+
+    Args:
+        array (array): input samples, 1-D.
+        size (int): window size. The first size - 1 outputs use the samples available.
+        q (float, optional): quantile in [0, 1]. Defaults to 0.5, i.e. rolling median.
+
+    Returns:
+        array: rolling quantile, same length as array.
+    """
+    window = SlidingQuantile(size, q)
+    output = []
+    for sample in numpy.asarray(array, dtype=float).ravel().tolist():
+        window.add_sample(sample)
+        output.append(window.get_quantile())
+
+    return numpy.array(output)
+
+
+class MinMaxNormalizer:
+    """
+    A streaming min-max normalizer, the stateful version of map.
+    The range of each channel is learnt from the data itself, either over
+    all samples seen so far (size=None) or over the most recent N frames
+    (one SlidingMinMax per channel),
+    and blocks are normalized into a preallocated or in-place output.
+
+    The learnt range can be saved and loaded, so the scaling used to train
+    a model (e.g. of_LSTM) is reused unchanged at inference.
+    """
+    def __init__(self, n_channels=1, size=None, is_bound=True, learn=True):
+        """
+        Args:
+            n_channels (int, optional): number of channels, the last axis of the data. Defaults to 1.
+            size (int, optional): window size in frames, None for the running range. Defaults to None.
+            is_bound (bool, optional): clip the output to [0, 1], as map. Defaults to True.
+            learn (bool, optional): update the range with each normalized block. Defaults to True.
+        """
+        self.n_channels = n_channels
+        self.size = size
+        self.is_bound = is_bound
+        self.learn = learn
+        self.reset()
+
+    def reset(self):
+        # Forget the learnt range, the output is identity until data arrives
+        self.x_min = numpy.full(self.n_channels, numpy.inf)     # minimum of each channel
+        self.x_max = numpy.full(self.n_channels, -numpy.inf)    # maximum of each channel
+        self.count = 0                                          # number of frames learnt
+        # windowed range: monotonic deques of each channel, O(1) amortized per sample
+        self.windows = [SlidingMinMax(self.size) for _ in range(self.n_channels)] if self.size else None
+        self._offset = numpy.zeros(self.n_channels)
+        self._gain = numpy.ones(self.n_channels)
+
+    def update(self, data):
+        # Learn the range from (n_frames, n_channels) data, or 1-D data of a single channel
+        frames = numpy.asarray(data, dtype=float).reshape(-1, self.n_channels)
+        if not len(frames):
+            return
+
+        if self.windows is None:
+            numpy.minimum(self.x_min, frames.min(axis=0), out=self.x_min)
+            numpy.maximum(self.x_max, frames.max(axis=0), out=self.x_max)
+        else:
+            # only the most recent N frames of a long block can be in the window
+            for c, window in enumerate(self.windows):
+                window.add_samples(frames[-self.size:, c])
+                self.x_min[c] = window.get_min()
+                self.x_max[c] = window.get_max()
+        self.count += len(frames)
+        self._set_scale()
+
+    def _set_scale(self):
+        # offset and gain of the output, a constant channel is mapped to 0
+        span = self.x_max - self.x_min
+        valid = span > 0
+        self._offset = self.x_min.copy()
+        self._gain = numpy.where(valid, 1.0 / numpy.where(valid, span, 1.0), 0.0)
+
+    def normalize(self, data, out=None):
+        """
+        Normalize data to the learnt range, learning from it first if enabled
+
+        Args:
+            data (array): (..., n_channels) samples, or 1-D samples of a single channel.
+            out (array, optional): preallocated output, may be data itself for in-place. Defaults to None.
+
+        Returns:
+            array: normalized data, a float for scalar input.
+        """
+        if self.learn:
+            self.update(data)
+
+        x = numpy.asarray(data)
+        out = _float_out(x, out)
+        numpy.subtract(x, self._offset if out.ndim else self._offset[0], out=out)
+        numpy.multiply(out, self._gain if out.ndim else self._gain[0], out=out)
+        if self.is_bound:
+            numpy.clip(out, 0.0, 1.0, out=out)
+
+        return out if out.ndim else float(out)
+
+    def denormalize(self, data, out=None):
+        # Map normalized data back to the learnt range
+        x = numpy.asarray(data)
+        out = _float_out(x, out)
+        span = self.x_max - self.x_min if self.count else numpy.ones(self.n_channels)
+        numpy.multiply(x, span if out.ndim else span[0], out=out)
+        numpy.add(out, self._offset if out.ndim else self._offset[0], out=out)
+        return out if out.ndim else float(out)
+
+    def get_state(self):
+        # Get the learnt scaling as a dictionary of plain python values
+        return {'n_channels': self.n_channels,
+                'size': self.size,
+                'is_bound': self.is_bound,
+                'count': self.count,
+                'x_min': self.x_min.tolist(),
+                'x_max': self.x_max.tolist()}
+
+    @classmethod
+    def from_state(cls, state, learn=False):
+        # Rebuild a normalizer from get_state, frozen by default for inference
+        normalizer = cls(state['n_channels'], state['size'], state['is_bound'], learn)
+        normalizer.count = state['count']
+        normalizer.x_min[:] = state['x_min']
+        normalizer.x_max[:] = state['x_max']
+        if normalizer.count:
+            normalizer._set_scale()
+        return normalizer
+
+    def save(self, path):
+        # Save the learnt scaling to a numpy .npz file
+        state = self.get_state()
+        state['size'] = state['size'] or 0
+        numpy.savez(path, **state)
+
+    @classmethod
+    def load(cls, path, learn=False):
+        # Load the scaling saved by save, frozen by default for inference
+        with numpy.load(path) as f:
+            state = {key: f[key].item() if f[key].ndim == 0 else f[key] for key in f.files}
+        state['size'] = state['size'] or None
+        return cls.from_state(state, learn)
@@ -0,0 +1,246 @@
+"""
+Spectral Analysis
+ - power spectrum of real signals using real FFT
+
+ Frequency axes and window functions are cached per (n, rate) and (window, n),
+ so repeated analysis of same length blocks does not rebuild them.
+
+ power_spectrum: one-sided power spectral density of a whole block.
+ welch:          PSD averaged over overlapping segments (Welch's method).
+ Spectrogram:    streaming short-time Fourier transform (STFT), only the
+                 segments completed by each new block are transformed.
+ BandPowerTracker: power in a few frequency bands of a sliding window,
+                 updated per sample by sliding DFT, without any full FFT.
+
+ PSD is in unit**2 / Hz, the same scaling as scipy.signal 'density'.
+
+"""
+
+import functools
+import numpy
+from Toolbox import of_Math
+
+
+@functools.lru_cache(maxsize=64)
+def get_frequencies(n, rate):
+    # frequency axis of the real FFT of n samples at sampling rate
+    freq = numpy.fft.rfftfreq(n, 1 / rate)
+    freq.flags.writeable = False
+    return freq
+
+
+@functools.lru_cache(maxsize=64)
+def get_window(name, n):
+    # periodic window function of n samples: 'hann', 'hamming', 'blackman' or 'rect'
+    k = 2 * numpy.pi * numpy.arange(n) / n
+    if name in (None, 'rect'):
+        window = numpy.ones(n)
+    elif name == 'hann':
+        window = 0.5 - 0.5 * numpy.cos(k)
+    elif name == 'hamming':
+        window = 0.54 - 0.46 * numpy.cos(k)
+    elif name == 'blackman':
+        window = 0.42 - 0.5 * numpy.cos(k) + 0.08 * numpy.cos(2 * k)
+    else:
+        raise ValueError(f'Unknown window: {name}')
+
+    window.flags.writeable = False
+    return window
+
+
+def _get_step(nperseg, noverlap):
+    # samples between the start of segments, at least 1
+    if noverlap is None:
+        noverlap = nperseg // 2
+    if not 0 <= noverlap < nperseg:
+        raise ValueError(f'noverlap must be in [0, nperseg), got {noverlap} for nperseg {nperseg}')
+    return nperseg - noverlap
+
+
+def _density(segments, rate, window, detrend):
+    # one-sided PSD of each segment along the last axis
+    n = segments.shape[-1]
+    w = get_window(window, n)
+    if detrend:
+        segments = segments - segments.mean(axis=-1, keepdims=True)
+
+    psd = numpy.abs(numpy.fft.rfft(segments * w, axis=-1)) ** 2 / (rate * numpy.dot(w, w))
+
+    # fold negative frequencies, except DC and Nyquist
+    psd[..., 1:(n + 1) // 2] *= 2
+    return psd
+
+
+def power_spectrum(array, rate, window='hann', detrend=True):
+    """
+    Power spectral density of a whole block.
+
+    Args:
+        array (array): input samples, 1-D.
+        rate (float): sampling rate in Hz.
+        window (str, optional): window function, see get_window. Defaults to 'hann'.
+        detrend (bool, optional): remove the mean before transform. Defaults to True.
+
+    Returns:
+        tuple: (freq, psd) one-sided, n // 2 + 1 bins.
+    """
+    x = numpy.asarray(array, dtype=float)
+    return get_frequencies(len(x), rate), _density(x, rate, window, detrend)
+
+
+def welch(array, rate, nperseg=256, noverlap=None, window='hann', detrend=True):
+    """
+    Power spectral density averaged over overlapping segments (Welch's method).
+    Segments are strided views of the data, transformed in one rfft call.
+
+    Args:
+        array (array): input samples, 1-D.
+        rate (float): sampling rate in Hz.
+        nperseg (int, optional): segment length, limited to the data length. Defaults to 256.
+        noverlap (int, optional): overlap between segments. Defaults to None, i.e. nperseg // 2.
+        window (str, optional): window function, see get_window. Defaults to 'hann'.
+        detrend (bool, optional): remove the mean of each segment. Defaults to True.
+
+    Returns:
+        tuple: (freq, psd) one-sided, nperseg // 2 + 1 bins.
+    """
+    x = numpy.asarray(array, dtype=float)
+    nperseg = min(nperseg, len(x))
+    step = _get_step(nperseg, noverlap)
+
+    segments = numpy.lib.stride_tricks.sliding_window_view(x, nperseg)[::step]
+    return get_frequencies(nperseg, rate), _density(segments, rate, window, detrend).mean(axis=0)
+
+
+class Spectrogram:
+    """
+    A streaming spectrogram (STFT) keeping the most recent frames.
+    Each new block only transforms the segments it completes,
+    so a live display never recomputes the full transform.
+    """
+    def __init__(self, rate, nperseg=256, noverlap=None, window='hann', history=100, detrend=True):
+        self.rate = rate                                            # sampling rate
+        self.nperseg = nperseg                                      # segment length
+        self.step = _get_step(nperseg, noverlap)                    # samples between segments
+        self.window = window                                        # window function name
+        self.detrend = detrend                                      # remove mean of each segment
+        self.freq = get_frequencies(nperseg, rate)                  # frequency axis
+        self.frames = of_Math.MultiSlidingWindow(history, len(self.freq))   # recent PSD frames
+        self.pending = numpy.zeros(0)                               # samples of the next segments
+        self.n_segments = 0                                         # segments transformed so far
+
+    def feed(self, samples):
+        # New block of samples arrived
+        # Return with (n_new, n_freq) PSD of the segments completed by this block
+        x = numpy.concatenate([self.pending, numpy.asarray(samples, dtype=float).ravel()])
+        n_new = (len(x) - self.nperseg) // self.step + 1 if len(x) >= self.nperseg else 0
+
+        psd = numpy.zeros((0, len(self.freq)))
+        if n_new:
+            segments = numpy.lib.stride_tricks.sliding_window_view(x, self.nperseg)[::self.step][:n_new]
+            psd = _density(segments, self.rate, self.window, self.detrend)
+            self.frames.add_samples(psd)
+
+        # keep the samples not consumed by a complete segment yet
+        self.pending = x[n_new * self.step:]
+        self.n_segments += n_new
+
+        return psd
+
+    def get_spectrogram(self):
+        # Get (times, freq, psd) of the recent frames, from the most old to the most new
+        # times are segment centres from the first sample fed; psd is a read-only view
+        psd = self.frames.get_window(copy=False)
+        first = self.n_segments - len(psd)
+        times = ((first + numpy.arange(len(psd))) * self.step + self.nperseg / 2) / self.rate
+        return times, self.freq, psd
+
+    def get_mean(self):
+        # Get (freq, psd) averaged over the recent frames
+        return self.freq, self.frames.get_mean()
+
+
+class BandPowerTracker:
+    """
+    Power in selected frequency bands over the most recent N samples,
+    using a sliding DFT of only the bins inside the bands: O(bins) per sample.
+    The bins are recomputed exactly from the window every N samples,
+    so rounding error of the recurrence cannot accumulate.
+    Samples are fed the same way as of_Math.SlidingWindow.
+    """
+    def __init__(self, rate, size, bands):
+        """
+        Args:
+            rate (float): sampling rate in Hz.
+            size (int): window size N, the bin resolution is rate / N.
+            bands (list): (low, high) frequency of each band in Hz, edges included.
+        """
+        self.rate = rate
+        self.size = size
+        self.bands = [tuple(band) for band in bands]
+
+        # DFT bins inside each band, and the union of them to track
+        edges = [(int(numpy.ceil(lo * size / rate)), int(numpy.floor(hi * size / rate))) for lo, hi in self.bands]
+        self.bins = numpy.unique(numpy.concatenate([numpy.arange(lo, hi + 1) for lo, hi in edges] + [[]])).astype(int)
+        self.members = [(self.bins >= lo) & (self.bins <= hi) for lo, hi in edges]
+
+        # one-sided power of a bin, Nyquist and DC are not folded
+        self.scale = numpy.where((self.bins == 0) | (2 * self.bins == size), 1.0, 2.0) / size ** 2
+
+        self.twiddle = numpy.exp(2j * numpy.pi * self.bins / size)      # shift of the window by one sample
+        self.window = of_Math.SlidingWindow(size)                       # most recent samples
+        self.X = numpy.zeros(len(self.bins), dtype=complex)             # DFT of the window at bins
+        self.updates = 0                                                # samples since the last exact DFT
+
+    def add_sample(self, sample):
+        # New sample arrived, slide the DFT by one sample
+        w = self.window
+        oldest = w.get_window(copy=False)[0] if w.count == w.size else 0.0
+        self.X = (self.X + (sample - oldest)) * self.twiddle
+        w.add_sample(sample)
+
+        # periodically discard the accumulated rounding error
+        self.updates += 1
+        if self.updates >= self.size:
+            self.recompute()
+
+    def add_samples(self, samples):
+        # New block of samples arrived, in time order
+        # slide the DFT by the whole block: X = t^m X + sum (x_i - old_i) t^(m - i)
+        samples = numpy.asarray(samples, dtype=float).ravel()
+        m = len(samples)
+        w = self.window
+        if m >= self.size or self.updates + m >= self.size:
+            w.add_samples(samples)
+            self.recompute()
+            return
+
+        # the samples leaving the window, zeros while it is filling up
+        leaving = numpy.zeros(m)
+        out = max(0, w.count + m - w.size)
+        leaving[m - out:] = w.get_window(copy=False)[:out]
+
+        powers = self.twiddle[numpy.newaxis] ** numpy.arange(m, 0, -1)[:, numpy.newaxis]
+        self.X = self.twiddle ** m * self.X + (samples - leaving) @ powers
+        w.add_samples(samples)
+        self.updates += m
+
+    def recompute(self):
+        # Exact DFT of the window at the tracked bins,
+        # with the window zero-padded at the front until it is full
+        window = numpy.zeros(self.size)
+        if self.window.count:
+            window[-self.window.count:] = self.window.get_window(copy=False)
+        basis = numpy.exp(-2j * numpy.pi * numpy.outer(numpy.arange(self.size), self.bins) / self.size)
+        self.X = window @ basis
+        self.updates = 0
+
+    def get_bin_power(self):
+        # Get (freq, power) of each tracked bin
+        return self.bins * self.rate / self.size, self.scale * numpy.abs(self.X) ** 2
+
+    def get_band_power(self):
+        # Get power (mean square) of the window in each band
+        # e.g. a sine of amplitude A inside a band gives about A ** 2 / 2
+        _, power = self.get_bin_power()
+        return numpy.array([power[member].sum() for member in self.members])
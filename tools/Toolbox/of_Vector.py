@@ -2,67 +2,103 @@ import numpy
 import sys
 
 
+def _stack(*rows):
+    # Build rotation matrices from their 9 elements, in row order
+    # elements are scalars or broadcastable arrays of angles,
+    # giving a (3, 3) array or a (..., 3, 3) stack
+    elements = numpy.broadcast_arrays(*[numpy.asarray(e, dtype=float) for e in rows])
+    return numpy.stack(elements, axis=-1).reshape(elements[0].shape + (3, 3))
+
 def Rx(theta):
     # Rotation Matrix in X-Axis
-    return numpy.matrix([[ 1, 0           , 0           ],
-                         [ 0, numpy.cos(theta),-numpy.sin(theta)],
-                         [ 0, numpy.sin(theta), numpy.cos(theta)]])
+    # theta: angle, or array of angles giving a (..., 3, 3) stack
+    c, s = numpy.cos(theta), numpy.sin(theta)
+    return _stack(1, 0, 0,
+                  0, c,-s,
+                  0, s, c)
   
 def Ry(theta):
     # Rotation Matrix in Y-Axis
-    return numpy.matrix([[ numpy.cos(theta), 0, numpy.sin(theta)],
-                         [ 0           , 1, 0           ],
-                         [-numpy.sin(theta), 0, numpy.cos(theta)]])
+    # theta: angle, or array of angles giving a (..., 3, 3) stack
+    c, s = numpy.cos(theta), numpy.sin(theta)
+    return _stack( c, 0, s,
+                   0, 1, 0,
+                  -s, 0, c)
   
 def Rz(theta):
     # Rotation Matrix in Z-Axis
-    return numpy.matrix([[ numpy.cos(theta), -numpy.sin(theta), 0 ],
-                         [ numpy.sin(theta), numpy.cos(theta) , 0 ],
-                         [ 0           , 0            , 1 ]])
+    # theta: angle, or array of angles giving a (..., 3, 3) stack
+    c, s = numpy.cos(theta), numpy.sin(theta)
+    return _stack( c,-s, 0,
+                   s, c, 0,
+                   0, 0, 1)
     
 def EulerXYZ(phi, theta, psi):
     # General XYZ Elementary Rotation Sequence 
-    # Using Matrix Multiplication
+    # Closed form of Rz(psi) @ Ry(theta) @ Rx(phi), each sin/cos evaluated once
     # Get Rotation Matrix from Euler Angles
-    Rxyz = Rz(psi) * Ry(theta) * Rx(phi)
-    return Rxyz
+    # angles: scalars, or arrays giving a (..., 3, 3) stack
+    c1, s1 = numpy.cos(phi), numpy.sin(phi)
+    c2, s2 = numpy.cos(theta), numpy.sin(theta)
+    c3, s3 = numpy.cos(psi), numpy.sin(psi)
+    return _stack(c3 * c2, c3 * s2 * s1 - s3 * c1, c3 * s2 * c1 + s3 * s1,
+                  s3 * c2, s3 * s2 * s1 + c3 * c1, s3 * s2 * c1 - c3 * s1,
+                  -s2    , c2 * s1               , c2 * c1)
 
 def EulerZYZ(phi, theta, psi):
     # General ZYZ Elementary Rotation Sequence 
-    # Using Matrix Multiplication
+    # Closed form of Rz(psi) @ Ry(theta) @ Rz(phi), each sin/cos evaluated once
     # Get Rotation Matrix from Euler Angles
-    Rzyz = Rz(psi) * Ry(theta) * Rz(phi)
-    return Rzyz
+    # angles: scalars, or arrays giving a (..., 3, 3) stack
+    c1, s1 = numpy.cos(phi), numpy.sin(phi)
+    c2, s2 = numpy.cos(theta), numpy.sin(theta)
+    c3, s3 = numpy.cos(psi), numpy.sin(psi)
+    return _stack(c3 * c2 * c1 - s3 * s1, -c3 * c2 * s1 - s3 * c1, c3 * s2,
+                  s3 * c2 * c1 + c3 * s1, -s3 * c2 * s1 + c3 * c1, s3 * s2,
+                  -s2 * c1              , s2 * s1                , c2)
+
+def _angles(R, eul1, eul2, eul3):
+    # Euler angles of a single matrix as a tuple of floats, of a stack as (..., 3)
+    if R.ndim == 2:
+        return float(eul1), float(eul2), float(eul3)
+    return numpy.stack([eul1, eul2, eul3], axis=-1)
 
 def inv_EulerXYZ(R):
     # Reverse XYZ Elementary Rotation
     # Get Euler Angles from Rotation Matrix
     # Get Phi (X), Theta (Y), Psi (Z), respectively
+    # R: (3, 3) matrix giving a tuple, or (..., 3, 3) stack giving (..., 3) angles
+    # i.e. EulerXYZ(*reversed(inv_EulerXYZ(R))) gives back R
+    R = numpy.asarray(R, dtype=float)
     tol = sys.float_info.epsilon * 10
-    if abs(R.item(0,0)) < tol and abs(R.item(1,0)) < tol:
-        eul1 = 0
-        eul2 = numpy.atan2(-R.item(2,0), R.item(0,0))
-        eul3 = numpy.atan2(-R.item(1,2), R.item(1,1))
-    else:   
-        eul1 = numpy.atan2(R.item(1,0), R.item(0,0))
-        sp = numpy.sin(eul1)
-        cp = numpy.cos(eul1)
-        eul2 = numpy.atan2(-R.item(2,0), cp * R.item(0,0) + sp * R.item(1,0))
-        eul3 = numpy.atan2(sp * R.item(0,2) - cp * R.item(1,2), cp * R.item(1,1) - sp * R.item(0,1))
-        
-    return eul1, eul2, eul3
+    # gimbal lock: phi is arbitrary, take 0 so that the general
+    # expressions below reduce to the singular solution
+    singular = (numpy.abs(R[..., 0, 0]) < tol) & (numpy.abs(R[..., 1, 0]) < tol)
+    eul1 = numpy.where(singular, 0.0, numpy.atan2(R[..., 1, 0], R[..., 0, 0]))
+    sp = numpy.sin(eul1)
+    cp = numpy.cos(eul1)
+    eul2 = numpy.atan2(-R[..., 2, 0], cp * R[..., 0, 0] + sp * R[..., 1, 0])
+    eul3 = numpy.atan2(sp * R[..., 0, 2] - cp * R[..., 1, 2], cp * R[..., 1, 1] - sp * R[..., 0, 1])
+
+    return _angles(R, eul1, eul2, eul3)
 
 def inv_EulerZYZ(R):
     # Reverse ZYZ Elementary Rotation
     # Get Euler Angles from Rotation Matrix
     # Get Phi (Z), Theta (Y), Psi (Z), respectively
-    eul1 = numpy.atan2(R.item(1,2), R.item(0,2))
+    # R: (3, 3) matrix giving a tuple, or (..., 3, 3) stack giving (..., 3) angles
+    # i.e. EulerZYZ(*reversed(inv_EulerZYZ(R))) gives back R
+    R = numpy.asarray(R, dtype=float)
+    tol = sys.float_info.epsilon * 10
+    # gimbal lock (theta of 0 or pi): phi is arbitrary, take 0
+    singular = (numpy.abs(R[..., 0, 2]) < tol) & (numpy.abs(R[..., 1, 2]) < tol)
+    eul1 = numpy.where(singular, 0.0, numpy.atan2(R[..., 1, 2], R[..., 0, 2]))
     sp = numpy.sin(eul1)
     cp = numpy.cos(eul1)
-    eul2 = numpy.atan2(cp * R.item(0,2) + sp * R.item(1,2), R.item(2,2))
-    eul3 = numpy.atan2(-sp * R.item(0,0) + cp * R.item(1,0), -sp * R.item(0,1) + cp * R.item(1,1))
+    eul2 = numpy.atan2(cp * R[..., 0, 2] + sp * R[..., 1, 2], R[..., 2, 2])
+    eul3 = numpy.atan2(-sp * R[..., 0, 0] + cp * R[..., 1, 0], -sp * R[..., 0, 1] + cp * R[..., 1, 1])
 
-    return eul1, eul2, eul3
+    return _angles(R, eul1, eul2, eul3)
 
 def rotate(R, v):
     return numpy.dot(R, v)
@@ -73,11 +109,57 @@ def rotation_matrix_from_vectors(vec1, vec2):
     :param vec2: A 3d "destination" vector
     :return mat: A transform matrix (3x3) which when applied to vec1, aligns it with vec2.
     """
-    a, b = (vec1 / numpy.linalg.norm(vec1)).reshape(3), (vec2 / numpy.linalg.norm(vec2)).reshape(3)
+    return rotations_from_vectors(numpy.reshape(vec1, 3), numpy.reshape(vec2, 3))
+
+def rotations_from_vectors(vec1, vec2, as_quaternion=False):
+    """ Find the rotations that align each vec1 to the corresponding vec2
+    :param vec1: (..., 3) "source" vectors
+    :param vec2: (..., 3) "destination" vectors, broadcast against vec1
+    :param as_quaternion: return (..., 4) quaternions [w, x, y, z] instead of matrices
+    :return: (..., 3, 3) rotation matrices, or (..., 4) unit quaternions
+    """
+    a = numpy.asarray(vec1, dtype=float)
+    b = numpy.asarray(vec2, dtype=float)
+    a, b = numpy.broadcast_arrays(a / numpy.linalg.norm(a, axis=-1, keepdims=True),
+                                  b / numpy.linalg.norm(b, axis=-1, keepdims=True))
     v = numpy.cross(a, b)
-    c = numpy.dot(a, b)
-    s = numpy.linalg.norm(v)
-    kmat = numpy.array([[0, -v[2], v[1]], [v[2], 0, -v[0]], [-v[1], v[0], 0]])
-    R = numpy.eye(3) + kmat + numpy.dot(kmat, kmat) * ((1 - c) / (s ** 2))
+    c = numpy.einsum('...i,...i->...', a, b)
+    # remove the rounding error of v along a: close to antiparallel it tilts
+    # the rotation axis by about eps / |v| and sends vec1 away from vec2
+    v -= numpy.einsum('...i,...i->...', v, a)[..., numpy.newaxis] * a
+    s2 = numpy.einsum('...i,...i->...', v, v)
+
+    # 1 + c, from s ** 2 = (1 - c)(1 + c) when the vectors point apart,
+    # which stays accurate close to antiparallel
+    h = numpy.where(c >= 0, 1 + c, s2 / numpy.where(c < 0, 1 - c, 1.0))
+
+    # antiparallel: half turn about any axis perpendicular to vec1
+    anti = h < sys.float_info.epsilon ** 2
+    axis = numpy.zeros(a.shape)
+    axis[..., 0] = 1.0
+    if anti.any():
+        a_anti = a[anti]
+        e = numpy.eye(3)[numpy.argmin(numpy.abs(a_anti), axis=-1)]
+        u = numpy.cross(a_anti, e)
+        axis[anti] = u / numpy.linalg.norm(u, axis=-1, keepdims=True)
+
+    if as_quaternion:
+        # half-way quaternion [1 + c, a x b], normalized
+        q = numpy.concatenate([h[..., numpy.newaxis], v], axis=-1)
+        q = numpy.where(anti[..., numpy.newaxis], numpy.concatenate([numpy.zeros(h.shape + (1,)), axis], axis=-1), q)
+        return q / numpy.linalg.norm(q, axis=-1, keepdims=True)
+
+    # Rodrigues: R = I + K + K^2 / (1 + c) = c I + K + v v^T / (1 + c)
+    R = numpy.einsum('...i,...j->...ij', v, v) / numpy.where(anti, 1.0, h)[..., numpy.newaxis, numpy.newaxis]
+    R[..., 0, 1] -= v[..., 2]
+    R[..., 0, 2] += v[..., 1]
+    R[..., 1, 0] += v[..., 2]
+    R[..., 1, 2] -= v[..., 0]
+    R[..., 2, 0] -= v[..., 1]
+    R[..., 2, 1] += v[..., 0]
+    R += c[..., numpy.newaxis, numpy.newaxis] * numpy.eye(3)
+
+    # antiparallel: R = 2 u u^T - I
+    R[anti] = 2 * numpy.einsum('...i,...j->...ij', axis[anti], axis[anti]) - numpy.eye(3)
     
     return R